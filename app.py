@@ -1,31 +1,31 @@
 from parsers.moex_prices import MoexPriceTQBR
+from parsers.moex_boards import parse_board_specs, ISS_URL
+from parsers.alerts import parse_alert_rules
+from parsers.migrations import apply_migrations
+from parsers.log_setup import setup_logging, parse_ticker_levels
+from parsers.metrics import MetricsServer
+from parsers.scheduler import PollScheduler, TradingCalendar, DEFAULT_SESSIONS, parse_weekdays
 from dotenv import load_dotenv
 import os
 from time import sleep
 import psycopg2
 
 
-def wait_for_db(host, port, user, password, dbname):
+def wait_for_db(pool):
     
     # Функция для ожидания доступности базы данных
     # До начала работы приложения требуется проверить
-    # Доступно ли подключение к БД, если нет - вернуть ошибку
+    # Доступно ли подключение к БД, если нет - повторять попытки.
+    # Соединение, открытое при проверке, остается в пуле
+    # и переиспользуется на первом цикле опроса
 
-    conn = None # устанавливаем флажок соединения на None
-    while conn is None: 
+    while True: 
         try:
             # попытка подключиться к БД
-            print(f'Connecting to the database at host {host}...')
-            # записываем результат в conn
-            conn = psycopg2.connect(
-                dbname=dbname,
-                user=user,
-                password=password,
-                host=host,
-                port=port
-            )
+            print(f'Connecting to the database at host {pool.host}...')
+            pool.ping()
             print('Database connection established.')
-            return conn # Возвращаем значение conn
+            return pool # Возвращаем пул с готовым соединением
         
         except psycopg2.OperationalError as e: # обработка исключений
             print('Database connection failed:', e) # Если соединение не удалось, вернуть в консоль исключение
@@ -48,11 +48,16 @@ def main():
     if  TEST_MODE == 1: # если тест флаг активен, то
         host = "localhost" # переключаемся на БД по адресу localhost для тестов.
 
-    # Возвращаем ответ соединения к БД в переменную conn
-    conn = wait_for_db(host, port, user, password, dbname)
-    if conn is None: # если None 
-        print("Failed to establish database connection after multiple retries.")
-        exit(1) # завершаемся с кодом 1
+    # Настраиваем логирование: очередь + фоновый поток, JSON-строки в log.txt с ротацией по размеру.
+    # LOG_TICKER_LEVELS задает уровень детализации по отдельным тикерам, например SBER=DEBUG,GAZP=WARNING
+    setup_logging(
+        logfile='log.txt',
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        ticker_levels=parse_ticker_levels(os.getenv("LOG_TICKER_LEVELS", "")),
+        ticker_default_level=os.getenv("LOG_TICKER_LEVEL", "INFO").upper()
+    )
 
     # Создаем экземпляр класса fetcher для получения тикеров и цен TQBR
     # Таже передаем ему параметры подключения к БД для записи. 
@@ -63,23 +68,78 @@ def main():
         password=password,
         host=host,
         port=port,
-        logfile='log.txt'
+        logfile='log.txt',
+        # Способ записи цен в БД: row, values или copy (по умолчанию copy)
+        write_mode=os.getenv("DB_WRITE_MODE", "copy"),
+        # Режимы торгов для параллельного опроса, первый - основной
+        boards=parse_board_specs(os.getenv("BOARDS", "stock/shares/TQBR")),
+        # Адрес ISS API; для проверок без сети - локальный заменитель (python -m parsers.iss_fixture)
+        iss_url=os.getenv("ISS_URL") or ISS_URL,
+        # Таймаут каждого HTTP-запроса к MOEX API в секундах
+        http_timeout=float(os.getenv("HTTP_TIMEOUT", "15")),
+        # Режим записи только изменившихся цен и период полного снимка в минутах
+        delta_mode=os.getenv("DB_DELTA_MODE", "0") == "1",
+        heartbeat_minutes=int(os.getenv("DB_DELTA_HEARTBEAT_MINUTES", "0")),
+        # Сколько месяцев хранить партиции tqbr_prices, 0 - хранить все
+        retention_months=int(os.getenv("DB_RETENTION_MONTHS", "0")),
+        # Необязательная выгрузка цен основного режима в JSON-файл, пусто - не выгружать
+        json_export=os.getenv("JSON_EXPORT_PATH") or None,
+        # Локальная очередь снимков на время недоступности БД, пусто - без очереди
+        spool_path=os.getenv("SPOOL_PATH") or None,
+        spool_batch=int(os.getenv("SPOOL_REPLAY_BATCH", "50")),
+        # Повторы запроса к MOEX API с экспоненциальной паузой
+        fetch_retries=int(os.getenv("FETCH_RETRIES", "3")),
+        fetch_backoff=float(os.getenv("FETCH_BACKOFF", "1")),
+        # Правила оповещений через ';', например SBER>300;SBER move 2/15;* stale 30
+        alert_rules=parse_alert_rules(os.getenv("ALERT_RULES", "")),
+        # Необязательный webhook для оповещений и период повтора активного оповещения в минутах
+        alert_webhook=os.getenv("ALERT_WEBHOOK_URL") or None,
+        alert_repeat_minutes=float(os.getenv("ALERT_REPEAT_MINUTES", "0")),
+        # Порог z-оценки доходности, выше которого тикер попадает в выбросы
+        outlier_zscore=float(os.getenv("OUTLIER_ZSCORE", "3"))
     )
+
+    # HTTP-эндпоинт метрик в формате Prometheus на порту приложения (APP_DOCKER_PORT), 0 - отключен.
+    # METRICS_DEBUG=1 включает /debug/profile и /debug/tracemalloc для диагностики медленных циклов
+    metrics_port = int(os.getenv("METRICS_PORT") or os.getenv("APP_DOCKER_PORT") or "0")
+    if metrics_port:
+        MetricsServer(
+            metrics_port,
+            debug=os.getenv("METRICS_DEBUG", "0") == "1",
+            profile_dir=os.getenv("METRICS_PROFILE_DIR", ".")
+        ).start()
+        print(f'Metrics endpoint listening on port {metrics_port}.')
+
+    # Ждем доступности БД через пул соединений fetcher'а
+    wait_for_db(fetcher.db)
+    # Приводим схему БД к актуальной версии и готовим партиции
+    apply_migrations(fetcher.db)
+    fetcher.maintain_partitions()
+    # В режиме delta подтягиваем последние записанные цены
+    fetcher.seed_last_prices()
     
-    # Интервал обновления — периодичность запуска в секундах.
-    # Устанавливаем необходимое время опроса. Это значение устанавливает 
-    # В приложении sleep до следующей итерации
+    # Интервал обновления — периодичность запуска в секундах во время торговой сессии.
+    # Опросы выравниваются по часам: при 300 секундах это ровно :00, :05, :10...
     update_interval = int(os.getenv("TIME_SLEEP"))
+    # Интервал вне торговой сессии, 0 - не опрашивать до открытия сессии
+    closed_interval = int(os.getenv("TIME_SLEEP_CLOSED", str(update_interval)))
     
-    # Бесконечный цикл для периодического выполнения задач    
-    while TEST_MODE == 0: # если мы не в тестовом режиме
-        print('Fetching new prices and updating the database...')
-        fetcher.get_prices()
-        fetcher.update_db()
-        fetcher.show_prices()
-        fetcher.calculate_null_prices_percentage()
-        print(f"Sleeping for {update_interval} seconds.")
-        sleep(update_interval)  # Ожидаем заданный интервал перед следующим обновлением.
+    if TEST_MODE == 0: # если мы не в тестовом режиме
+        # Бесконечный цикл опроса по расписанию торговых сессий MOEX.
+        # Опрос и запись в БД идут в разных потоках через ограниченную очередь
+        scheduler = PollScheduler(
+            fetcher,
+            interval=update_interval,
+            closed_interval=closed_interval,
+            calendar=TradingCalendar(
+                sessions=os.getenv("MOEX_SESSIONS", DEFAULT_SESSIONS),
+                weekdays=parse_weekdays(os.getenv("MOEX_TRADING_DAYS", "0,1,2,3,4"))
+            ),
+            queue_size=int(os.getenv("PIPELINE_QUEUE_SIZE", "2")),
+            overflow=os.getenv("PIPELINE_OVERFLOW", "drop_oldest")
+        )
+        print('Starting the polling scheduler...')
+        scheduler.run()
     else:
         # Иначе если 1 или все что угодно, то тестовый режим - исполняем код один раз
         # Эта логика реализована для того чтобы приложение не зацикливалось на выполнении тестирования
@@ -87,10 +147,11 @@ def main():
         # шагам пайплайна.
         print("WARNING! TEST MODE ON")
         print('Running in test mode (one-time execution)...')
-        fetcher.get_prices()
-        fetcher.update_db()
-        fetcher.show_prices()
-        fetcher.calculate_null_prices_percentage()
+        snapshots = fetcher.get_prices() # снимки цен передаются дальше в памяти, без JSON-файла
+        if not snapshots:
+            exit(1) # в тестовом режиме отсутствие данных API - ошибка пайплайна
+        fetcher.update_db(snapshots) # цены всех режимов и процент нулевых цен пишутся одной транзакцией
+        fetcher.show_prices(snapshots.get(fetcher.primary_board))
 
 # выполняем main
 if __name__ == "__main__":
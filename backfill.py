@@ -0,0 +1,82 @@
+from parsers.backfill import Backfill, CandlesFetcher, Checkpoint, parse_day
+from parsers.db_pool import DbPool
+from parsers.migrations import apply_migrations
+from parsers.moex_boards import ISS_URL, MoexBoardsFetcher, parse_board_specs
+from parsers.scheduler import MSK
+from dotenv import load_dotenv
+from datetime import datetime, timedelta
+import argparse
+import os
+
+
+# Историческая загрузка цен из свечей ISS в tqbr_prices.
+# Заполняет пустую БД при новом развертывании и дыры после простоя.
+# Примеры:
+#   python backfill.py --from 2024-01-01 --till 2024-01-31 --tickers SBER,GAZP
+#   python backfill.py --from 2024-01-01   (все тикеры основного режима, до вчерашнего дня)
+# Повторный запуск за тот же период не создает дублей, а прерванный -
+# продолжается с последней загруженной пары (тикер, день) из checkpoint-файла.
+
+def parse_args():
+    yesterday = (datetime.now(MSK) - timedelta(days=1)).date()
+    parser = argparse.ArgumentParser(description='Backfill tqbr_prices from MOEX ISS candles')
+    parser.add_argument('--from', dest='start', type=parse_day, required=True, help='first day, YYYY-MM-DD')
+    parser.add_argument('--till', dest='end', type=parse_day, default=yesterday, help='last day, YYYY-MM-DD (default: yesterday)')
+    parser.add_argument('--tickers', default='', help='comma separated tickers (default: all tickers of the board)')
+    parser.add_argument('--board', default=os.getenv("BOARDS", "stock/shares/TQBR").split(',')[0],
+                        help='engine/market/board (default: first of BOARDS)')
+    parser.add_argument('--interval', type=int, default=int(os.getenv("BACKFILL_INTERVAL", "1")),
+                        help='ISS candle interval: 1, 10, 60 minutes or 24 for daily')
+    parser.add_argument('--workers', type=int, default=int(os.getenv("BACKFILL_WORKERS", "8")))
+    parser.add_argument('--rps', type=float, default=float(os.getenv("BACKFILL_RPS", "10")),
+                        help='max ISS requests per second, 0 - unlimited')
+    parser.add_argument('--batch', type=int, default=50, help='ticker-days per DB transaction')
+    parser.add_argument('--checkpoint', default=os.getenv("BACKFILL_CHECKPOINT", "backfill_checkpoint.json"))
+    # Пустой ISS_URL в .env означает адрес по умолчанию, как в app.py
+    parser.add_argument('--iss-url', default=os.getenv("ISS_URL") or ISS_URL)
+    return parser.parse_args()
+
+
+def main():
+    load_dotenv() # загружаем переменные среды до разбора аргументов: от них зависят значения по умолчанию
+    args = parse_args()
+    spec = parse_board_specs(args.board)[0]
+
+    db = DbPool(
+        os.getenv("DB_NAME"),
+        os.getenv("DB_USER"),
+        os.getenv("DB_PASSWORD"),
+        os.getenv("DB_HOST", "localhost"),
+        os.getenv("DB_PORT", os.getenv("DB_OS_PORT", "5432"))
+    )
+    # Схема должна быть актуальной так же, как при запуске app.py
+    apply_migrations(db)
+
+    tickers = [ticker.strip() for ticker in args.tickers.split(',') if ticker.strip()]
+    if not tickers:
+        # Список тикеров режима берем из текущей маркетдаты
+        boards = MoexBoardsFetcher([spec], args.iss_url)
+        tickers = [security[0] for security in boards.fetch_board(spec)]
+        boards.close()
+
+    fetcher = CandlesFetcher(spec, args.interval, args.iss_url, rate=args.rps, pool_size=args.workers)
+    backfill = Backfill(db, fetcher, Checkpoint(args.checkpoint, spec.board, args.interval),
+                        workers=args.workers, batch_units=args.batch)
+    try:
+        stats = backfill.run(tickers, args.start, args.end)
+    finally:
+        fetcher.close()
+        db.closeall()
+
+    print(f"Backfill finished: {stats['units']} ticker-days in {stats['seconds']:.1f} s "
+          f"({stats['ticker_days_per_sec']:.1f} ticker-days/sec), "
+          f"{stats['rows']} candles fetched, {stats['inserted']} rows inserted, "
+          f"{stats['skipped']} ticker-days skipped by checkpoint, {stats['errors']} errors, "
+          f"{fetcher.stats['requests']} ISS requests.")
+    if stats['errors']:
+        exit(1)
+
+
+# выполняем main
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Бенчмарк проверки правил оповещений AlertEngine.
+
+Гоняет поток синтетических снимков (случайное блуждание цен) через набор
+правил: пороги, движение за окно и устаревание на каждый тикер.
+Выводит время проверки одного снимка и одной пары (правило, тикер),
+а также число оповещений, дошедших до локального webhook.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_alerts.py --tickers 250 --rules-per-ticker 8 --snapshots 2000
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+from time import perf_counter
+
+# Добавляем корень репозитория в путь, чтобы импортировать parsers
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers.alerts import AlertEngine, LocalWebhook, MoveRule, StaleRule, ThresholdRule, WebhookSink
+from parsers.snapshot import PriceSnapshot
+
+
+def make_rules(tickers, per_ticker):
+    # На каждый тикер: пороги вокруг стартовой цены, движения с разными окнами и устаревание
+    rules = []
+    for ticker in tickers:
+        for i in range(per_ticker):
+            kind = i % 4
+            if kind == 0:
+                rules.append(ThresholdRule(ticker, '>', 110 + i))
+            elif kind == 1:
+                rules.append(ThresholdRule(ticker, '<', 90 - i))
+            elif kind == 2:
+                rules.append(MoveRule(ticker, 1 + i / 4, 5 + i * 5))
+            else:
+                rules.append(StaleRule(ticker, 10 + i))
+    return rules
+
+
+def main():
+    parser = argparse.ArgumentParser(description='AlertEngine benchmark')
+    parser.add_argument('--tickers', type=int, default=250)
+    parser.add_argument('--rules-per-ticker', type=int, default=8)
+    parser.add_argument('--snapshots', type=int, default=2000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    tickers = [f"T{i:05d}" for i in range(args.tickers)]
+    rules = make_rules(tickers, args.rules_per_ticker)
+
+    webhook = LocalWebhook().start()
+    sink = WebhookSink(webhook.url)
+    engine = AlertEngine(rules, sink)
+
+    # Снимки готовим заранее, чтобы замерять только проверку правил
+    prices = [100.0] * args.tickers
+    started = datetime.now().astimezone()
+    snapshots = []
+    for n in range(args.snapshots):
+        prices = [price * (1 + rng.gauss(0, 0.002)) if rng.random() > 0.05 else price for price in prices]
+        snapshots.append(PriceSnapshot('TQBR', started + timedelta(minutes=n), tickers, prices))
+
+    elapsed = 0.0
+    for snapshot in snapshots:
+        t = perf_counter()
+        engine.evaluate(snapshot)
+        elapsed += perf_counter() - t
+    sink.close()
+    webhook.stop()
+
+    stats = engine.stats
+    print(f"rules={len(rules)} tickers={args.tickers} snapshots={args.snapshots}")
+    print(f"per snapshot: {elapsed / args.snapshots * 1e6:10.1f} us")
+    print(f"per check:    {elapsed / stats['checks'] * 1e9:10.1f} ns")
+    print(f"fired={stats['fired']} suppressed={stats['suppressed']} "
+          f"webhook received={len(webhook.received)} errors={sink.stats['errors']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Микро-бенчмарк аналитики снимков: циклы Python против NumPy (parsers/analytics.py).
+
+Для каждого размера снимка (по умолчанию 250, 5 000 и 50 000 инструментов)
+замеряет долю Null, доходности относительно предыдущего снимка, ширину рынка
+и выбросы по z-оценке. Python-вариант работает со списком [[SECID, LAST], ...],
+как раньше работали calculate_null_prices_percentage и show_prices.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_analytics.py --sizes 250,5000,50000 --repeat 50
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+from datetime import datetime
+from time import perf_counter
+
+# Добавляем корень репозитория в путь, чтобы импортировать parsers
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers.analytics import ColumnarSnapshot, TickerIndex, breadth, null_ratio, returns, zscore_outliers
+from parsers.snapshot import PriceSnapshot
+
+
+def make_data(size, rng, previous=None):
+    # Ответ ISS в исходном виде: каждый десятый тикер без цены
+    if previous is None:
+        return [[f"T{i:06d}", None if i % 10 == 0 else 100 + rng.random()] for i in range(size)]
+    return [[ticker, None if price is None else price * (1 + rng.gauss(0, 0.01))] for ticker, price in previous]
+
+
+def python_analytics(previous, current, threshold):
+    # Прежний подход: проход по спискам и словарь прежних цен
+    nulls = sum(1 for _, price in current if price is None)
+    previous_prices = dict(previous)
+    changes = {}
+    for ticker, price in current:
+        base = previous_prices.get(ticker)
+        if price is not None and base:
+            changes[ticker] = price / base - 1
+    advancers = sum(1 for change in changes.values() if change > 0)
+    decliners = sum(1 for change in changes.values() if change < 0)
+    mean = sum(changes.values()) / len(changes)
+    std = math.sqrt(sum((change - mean) ** 2 for change in changes.values()) / len(changes))
+    outliers = [ticker for ticker, change in changes.items() if abs(change - mean) / std > threshold]
+    return nulls / len(current), advancers, decliners, outliers
+
+
+def numpy_analytics(index, previous, current, threshold):
+    previous = ColumnarSnapshot.from_snapshot(previous, index)
+    current = ColumnarSnapshot.from_snapshot(current, index)
+    changes = returns(previous, current, len(index))
+    advancers, decliners, _ = breadth(changes)
+    positions, _ = zscore_outliers(changes, threshold)
+    return null_ratio(current), advancers, decliners, positions
+
+
+def timeit(func, repeat):
+    # Среднее время одного вызова в микросекундах
+    started = perf_counter()
+    for _ in range(repeat):
+        func()
+    return (perf_counter() - started) / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Snapshot analytics micro-benchmark')
+    parser.add_argument('--sizes', default='250,5000,50000', help='snapshot sizes, comma separated')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--threshold', type=float, default=3.0)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    now = datetime.now().astimezone()
+    print(f"{'instruments':>12} {'python, us':>12} {'numpy, us':>12} {'speedup':>8}")
+    for size in (int(value) for value in args.sizes.split(',')):
+        previous_data = make_data(size, rng)
+        current_data = make_data(size, rng, previous_data)
+        previous = PriceSnapshot.from_iss(previous_data, 'TQBR', now)
+        current = PriceSnapshot.from_iss(current_data, 'TQBR', now)
+        index = TickerIndex()
+
+        # Результаты обоих вариантов должны совпадать
+        python_result = python_analytics(previous_data, current_data, args.threshold)
+        numpy_result = numpy_analytics(index, previous, current, args.threshold)
+        assert abs(python_result[0] - numpy_result[0]) < 1e-12
+        assert python_result[1:3] == numpy_result[1:3]
+        assert len(python_result[3]) == len(numpy_result[3])
+
+        python_us = timeit(lambda: python_analytics(previous_data, current_data, args.threshold), args.repeat)
+        numpy_us = timeit(lambda: numpy_analytics(index, previous, current, args.threshold), args.repeat)
+        print(f"{size:>12} {python_us:>12.1f} {numpy_us:>12.1f} {python_us / numpy_us:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
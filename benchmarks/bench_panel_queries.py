@@ -0,0 +1,167 @@
+"""
+Бенчмарк запросов панелей Grafana по tqbr_prices: старая схема против новой.
+
+В отдельной схеме bench_panels создаются две таблицы с одинаковыми данными:
+    legacy - quote_date/quote_time без индексов (схема до миграции 002)
+    ts     - timestamptz, индекс (ticker, ts DESC), помесячные партиции
+и замеряется задержка запроса панели "цена тикера" в старом и новом виде.
+По умолчанию 10M строк: 250 тикеров, снимок каждые 5 минут.
+Схема удаляется по окончании, если не указан --keep.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_panel_queries.py --rows 10000000 --repeat 20
+"""
+
+import argparse
+import os
+import statistics
+from time import perf_counter
+
+import psycopg2
+from dotenv import load_dotenv
+
+SCHEMA = 'bench_panels'
+
+SETUP_SQL = f"""
+DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;
+CREATE SCHEMA {SCHEMA};
+
+CREATE TABLE {SCHEMA}.legacy (
+    id SERIAL PRIMARY KEY,
+    quote_date DATE,
+    quote_time TIME,
+    ticker VARCHAR(255),
+    price NUMERIC,
+    board VARCHAR(16) DEFAULT 'TQBR'
+);
+
+CREATE TABLE {SCHEMA}.ts (
+    id BIGSERIAL,
+    ts TIMESTAMPTZ NOT NULL,
+    ticker VARCHAR(255),
+    price NUMERIC,
+    board VARCHAR(16) DEFAULT 'TQBR',
+    PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
+CREATE INDEX ON {SCHEMA}.ts (ticker, ts DESC);
+"""
+
+# Снимки идут назад от текущего момента: строка n - тикер n % tickers, снимок n / tickers
+FILL_SQL = f"""
+INSERT INTO {SCHEMA}.ts (ts, ticker, price)
+SELECT now() - (n / %(tickers)s) * INTERVAL '5 minutes',
+       CASE WHEN n %% %(tickers)s = 0 THEN 'SBER' ELSE 'T' || (n %% %(tickers)s) END,
+       100 + random()
+FROM generate_series(0, %(rows)s - 1) AS n;
+
+INSERT INTO {SCHEMA}.legacy (quote_date, quote_time, ticker, price)
+SELECT (ts AT TIME ZONE 'Europe/Moscow')::DATE, (ts AT TIME ZONE 'Europe/Moscow')::TIME, ticker, price
+FROM {SCHEMA}.ts;
+
+ANALYZE {SCHEMA}.legacy;
+ANALYZE {SCHEMA}.ts;
+"""
+
+# Запрос панели до миграции: вычисляемое время, без фильтра по времени, полный скан
+LEGACY_QUERY = f"""
+SELECT (quote_date + quote_time::time) AT TIME ZONE 'Europe/Moscow' AS "time", price
+FROM {SCHEMA}.legacy
+WHERE ticker = 'SBER'
+ORDER BY "time" DESC
+LIMIT 10000
+"""
+
+# Запрос панели после миграции: $__timeFilter(ts) раскрыт в диапазон последних %(days)s дней
+TS_QUERY = f"""
+SELECT ts AS "time", price
+FROM {SCHEMA}.ts
+WHERE ticker = 'SBER' AND ts BETWEEN now() - %(days)s * INTERVAL '1 day' AND now()
+ORDER BY ts DESC
+LIMIT 10000
+"""
+
+
+def create_partitions(cursor, rows, tickers):
+    # Помесячные партиции на весь диапазон синтетических данных
+    cursor.execute(
+        f"""
+        DO $$
+        DECLARE
+            month_start DATE;
+        BEGIN
+            FOR month_start IN
+                SELECT generate_series(
+                    date_trunc('month', now() - {rows // tickers + 1} * INTERVAL '5 minutes'),
+                    date_trunc('month', now()),
+                    INTERVAL '1 month')::DATE
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE {SCHEMA}.%I PARTITION OF {SCHEMA}.ts FOR VALUES FROM (%L) TO (%L)',
+                    'ts_y' || to_char(month_start, 'YYYY"m"MM'),
+                    month_start::TIMESTAMP AT TIME ZONE 'UTC',
+                    (month_start + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC');
+            END LOOP;
+        END;
+        $$;
+        """
+    )
+
+
+def measure(cursor, query, params, repeat):
+    # Задержки запроса в миллисекундах, первый прогон прогревает кэш и не учитывается
+    cursor.execute(query, params)
+    cursor.fetchall()
+    timings = []
+    for _ in range(repeat):
+        started = perf_counter()
+        cursor.execute(query, params)
+        cursor.fetchall()
+        timings.append((perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Benchmark Grafana panel queries on tqbr_prices layouts")
+    parser.add_argument("--rows", type=int, default=10_000_000, help="rows to generate")
+    parser.add_argument("--tickers", type=int, default=250, help="tickers per snapshot")
+    parser.add_argument("--days", type=int, default=7, help="dashboard time range in days")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per query")
+    parser.add_argument("--host", default="localhost", help="postgres host")
+    parser.add_argument("--keep", action="store_true", help="keep the bench schema")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=args.host,
+        port=os.getenv("DB_OS_PORT", "5432"),
+    )
+    conn.autocommit = True
+    cursor = conn.cursor()
+    try:
+        print(f"Generating {args.rows} rows for {args.tickers} tickers...")
+        started = perf_counter()
+        cursor.execute(SETUP_SQL)
+        create_partitions(cursor, args.rows, args.tickers)
+        cursor.execute(FILL_SQL, {'rows': args.rows, 'tickers': args.tickers})
+        print(f"Data ready in {perf_counter() - started:.1f} s")
+
+        for name, query, params in (
+            ('legacy', LEGACY_QUERY, None),
+            ('ts', TS_QUERY, {'days': args.days}),
+        ):
+            timings = measure(cursor, query, params, args.repeat)
+            p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+            print(f"{name:>6}: p50={statistics.median(timings):9.2f} ms  p95={p95:9.2f} ms")
+    finally:
+        if not args.keep:
+            cursor.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
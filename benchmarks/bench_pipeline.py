@@ -0,0 +1,216 @@
+"""
+Бенчмарк полного цикла MoexPriceTQBR без сети: get_prices -> update_db -> метрики.
+
+Вместо iss.moex.com запросы идут в локальный SyntheticIss (parsers/iss_fixture.py)
+с заданным числом инструментов, задержкой ответа и долей ошибок. Он запускается
+отдельным процессом (python -m parsers.iss_fixture --synthetic N), чтобы его потоки
+не конкурировали за GIL с замеряемым кодом, а его память не попадала в пиковый RSS. Запись идет
+в локальный postgres (параметры из .env, хост по умолчанию localhost); по умолчанию
+для прогона создается временная база, к ней применяются миграции, после прогона
+база удаляется (--keep-db оставляет ее, --no-ephemeral пишет прямо в DB_NAME).
+
+Результат: циклов в секунду, p50/p99 длительности цикла, пиковый RSS процесса
+и среднее время этапов из реестра метрик. Результат сравнивается с базовой линией
+в JSON-файле (ключ - сценарий: инструменты, задержка, ошибки, способ записи).
+Если сценария в файле нет или задан --update-baseline, результат записывается
+как новая базовая линия. При ухудшении больше чем на --tolerance скрипт
+печатает REGRESSION и завершается с кодом 1.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_pipeline.py --instruments 250 --cycles 50
+    python benchmarks/bench_pipeline.py --instruments 5000 --latency-ms 50 --error-rate 0.05
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+from time import perf_counter
+
+import psycopg2
+import requests
+from dotenv import load_dotenv
+
+# Добавляем корень репозитория в путь, чтобы импортировать parsers
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from parsers.log_setup import setup_logging
+from parsers.metrics import METRICS
+from parsers.migrations import apply_migrations
+from parsers.moex_boards import BoardSpec
+from parsers.moex_prices import MoexPriceTQBR, WRITE_MODES
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline_pipeline.json')
+
+
+def percentile(values, share):
+    # Перцентиль по ближайшему рангу
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+def peak_rss_mb():
+    # ru_maxrss в Linux - килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def stage_means_ms():
+    # Среднее время этапов по гистограммам реестра метрик
+    return {
+        dict(labels)['stage']: histogram.sum / histogram.count * 1000
+        for (name, labels), histogram in sorted(METRICS.histograms.items())
+        if name == 'stage_seconds' and histogram.count
+    }
+
+
+def admin_execute(params, statement):
+    # CREATE/DROP DATABASE нельзя выполнять в транзакции
+    conn = psycopg2.connect(dbname='postgres', **params)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(statement)
+    finally:
+        conn.close()
+
+
+def start_synthetic_iss(instruments, latency, error_rate):
+    # Синтетический ISS в отдельном процессе; порт выбирает ОС, адрес процесс печатает первой строкой
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'parsers.iss_fixture', '--synthetic', str(instruments),
+         '--latency', str(latency), '--error-rate', str(error_rate), '--port', '0'],
+        cwd=ROOT, stdout=subprocess.PIPE, text=True
+    )
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f"synthetic ISS exited with code {process.returncode}")
+    return process, line.rsplit(' at ', 1)[1].strip()
+
+
+def run_cycles(fetcher, cycles, warmup):
+    # Циклы идут подряд, как в TEST_APP_MODE, без ожидания меток планировщика
+    latencies = []
+    for cycle in range(warmup + cycles):
+        if cycle == warmup:
+            # Время этапов считаем только по замеряемым циклам
+            METRICS.histograms.clear()
+        started = perf_counter()
+        snapshots = fetcher.get_prices()
+        fetcher.update_db(snapshots)
+        if cycle >= warmup:
+            latencies.append(perf_counter() - started)
+    return latencies
+
+
+def compare(result, baseline, tolerance):
+    # Список ухудшений относительно базовой линии
+    regressions = []
+    if result['cycles_per_sec'] < baseline['cycles_per_sec'] * (1 - tolerance):
+        regressions.append(f"cycles/sec {result['cycles_per_sec']:.2f} < baseline {baseline['cycles_per_sec']:.2f}")
+    for key in ('p50_ms', 'p99_ms', 'peak_rss_mb'):
+        if result[key] > baseline[key] * (1 + tolerance):
+            regressions.append(f"{key} {result[key]:.1f} > baseline {baseline[key]:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline get_prices -> update_db pipeline benchmark')
+    parser.add_argument('--instruments', type=int, default=250)
+    parser.add_argument('--boards', type=int, default=1, help='number of synthetic boards polled per cycle')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='synthetic ISS response delay')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of synthetic ISS responses failing with 500')
+    parser.add_argument('--cycles', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--write-mode', choices=WRITE_MODES, default='copy')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative degradation')
+    parser.add_argument('--no-ephemeral', action='store_true', help='write into DB_NAME instead of a temporary database')
+    parser.add_argument('--keep-db', action='store_true', help='do not drop the temporary database')
+    args = parser.parse_args()
+
+    load_dotenv()
+    params = {
+        'user': os.getenv("DB_USER"),
+        'password': os.getenv("DB_PASSWORD"),
+        'host': os.getenv("DB_HOST", "localhost"),
+        'port': os.getenv("DB_PORT", os.getenv("DB_OS_PORT", "5432")),
+    }
+    dbname = os.getenv("DB_NAME")
+    if not args.no_ephemeral:
+        dbname = f"moex_bench_{os.getpid()}"
+        admin_execute(params, f"CREATE DATABASE {dbname}")
+
+    # Логи цикла в консоль не нужны: только предупреждения и ошибки во временный файл
+    log_dir = tempfile.mkdtemp(prefix='moex_bench_')
+    setup_logging(os.path.join(log_dir, 'log.txt'), level='WARNING')
+
+    iss, iss_url = start_synthetic_iss(args.instruments, args.latency_ms / 1000, args.error_rate)
+    boards = [BoardSpec('stock', 'shares', f"B{board:02d}") for board in range(args.boards)]
+    fetcher = MoexPriceTQBR(
+        dbname, params['user'], params['password'], params['host'], params['port'],
+        logfile=os.path.join(log_dir, 'log.txt'), write_mode=args.write_mode,
+        boards=boards, iss_url=iss_url, fetch_backoff=0.05
+    )
+    try:
+        apply_migrations(fetcher.db, log=lambda message: None)
+        fetcher.maintain_partitions()
+        latencies = run_cycles(fetcher, args.cycles, args.warmup)
+        # Счетчики запросов синтетического ISS
+        iss_stats = requests.get(f"{iss_url.rsplit('/iss', 1)[0]}/stats", timeout=5).json()
+    finally:
+        fetcher.db.closeall()
+        iss.terminate()
+        iss.wait()
+        if not args.no_ephemeral and not args.keep_db:
+            admin_execute(params, f"DROP DATABASE {dbname}")
+
+    scenario = f"{args.instruments}i_{args.boards}b_{args.latency_ms:g}ms_{args.error_rate:g}err_{args.write_mode}"
+    result = {
+        'cycles_per_sec': len(latencies) / sum(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'peak_rss_mb': peak_rss_mb(),
+        'cycles': len(latencies),
+        'iss_requests': iss_stats['requests'],
+        'iss_errors': iss_stats['errors'],
+        'stages_ms': stage_means_ms(),
+        'recorded_at': datetime.now().astimezone().isoformat(timespec='seconds'),
+    }
+
+    print(f"scenario {scenario}")
+    print(f"cycles/sec {result['cycles_per_sec']:.2f}, p50 {result['p50_ms']:.1f} ms, "
+          f"p99 {result['p99_ms']:.1f} ms, peak RSS {result['peak_rss_mb']:.1f} MB, "
+          f"ISS requests {result['iss_requests']} ({result['iss_errors']} failed)")
+    for stage, mean in result['stages_ms'].items():
+        print(f"  {stage:<16} {mean:8.2f} ms")
+
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baselines = json.load(baseline_file)
+    baseline = baselines.get(scenario)
+
+    regressions = compare(result, baseline, args.tolerance) if baseline and not args.update_baseline else []
+    if baseline is None or args.update_baseline:
+        baselines[scenario] = result
+        with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(baselines, baseline_file, indent=2, sort_keys=True)
+        print(f"Baseline for {scenario} saved to {args.baseline}")
+    elif regressions:
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        sys.exit(1)
+    else:
+        print(f"No regressions against baseline recorded at {baseline['recorded_at']} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Бенчмарк способов записи снимка цен в tqbr_prices.
+
+Сравнивает скорость (строк в секунду) для режимов row, values и copy
+метода MoexPriceTQBR.write_prices на локальном postgres.
+Параметры подключения берутся из .env (как в app.py), хост по умолчанию localhost.
+Каждый прогон выполняется в транзакции и откатывается, таблица не засоряется.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_write_modes.py --tickers 250 --repeat 20
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+from time import perf_counter
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Добавляем корень репозитория в путь, чтобы импортировать parsers
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers.moex_prices import MoexPriceTQBR, WRITE_MODES
+
+
+def make_rows(tickers):
+    # Синтетический снимок: каждый десятый тикер без цены, как вне торговой сессии
+    now = datetime.now().astimezone()
+    return [
+        (now, f"T{i:05d}", None if i % 10 == 0 else 100 + i / 100, 'TQBR')
+        for i in range(tickers)
+    ]
+
+
+def bench_mode(fetcher, conn, mode, rows, repeat):
+    # Замер одного режима: repeat раз пишем снимок и откатываем транзакцию
+    elapsed = 0.0
+    for _ in range(repeat):
+        cursor = conn.cursor()
+        started = perf_counter()
+        fetcher.write_prices(cursor, rows, mode=mode)
+        elapsed += perf_counter() - started
+        cursor.close()
+        conn.rollback()
+    return len(rows) * repeat / elapsed
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Benchmark tqbr_prices write modes")
+    parser.add_argument("--tickers", type=int, default=250, help="rows per snapshot")
+    parser.add_argument("--repeat", type=int, default=20, help="snapshots per mode")
+    parser.add_argument("--host", default="localhost", help="postgres host")
+    args = parser.parse_args()
+
+    params = dict(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=args.host,
+        port=os.getenv("DB_OS_PORT", "5432"),
+    )
+    fetcher = MoexPriceTQBR(**params)
+    conn = psycopg2.connect(**params)
+
+    rows = make_rows(args.tickers)
+    print(f"Snapshot size: {args.tickers} rows, {args.repeat} snapshots per mode")
+    try:
+        for mode in WRITE_MODES:
+            rate = bench_mode(fetcher, conn, mode, rows, args.repeat)
+            print(f"{mode:>6}: {rate:12.0f} rows/sec")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
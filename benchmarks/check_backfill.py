@@ -0,0 +1,173 @@
+"""
+Проверка исторической загрузки (backfill.py) без сети на записанных ответах ISS.
+
+Свечи берутся из fixtures/iss через IssFixtureServer (parsers/iss_fixture.py):
+тикеры SBER и GAZP за 2024-01-08..2024-01-09, часть дней занимает две страницы
+по 500 свечей. Запись идет во временную базу локального postgres (параметры
+из .env, хост по умолчанию localhost), после проверки база удаляется.
+
+Сценарии:
+    прерванный запуск - часть пар (тикер, день) падает с ошибкой и не попадает в checkpoint;
+    продолжение - тот же checkpoint, загружаются только оставшиеся пары;
+    повторный запуск - новый checkpoint за тот же период, дублей не появляется;
+    живые данные - минута, уже записанная опросом, не дополняется свечой.
+
+Запуск из корня репозитория:
+    python benchmarks/check_backfill.py
+При расхождении скрипт печатает FAILED и завершается с кодом 1.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+from datetime import date
+
+import psycopg2
+from dotenv import load_dotenv
+
+# Добавляем корень репозитория в путь, чтобы импортировать parsers
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from parsers.backfill import Backfill, CandlesFetcher, Checkpoint
+from parsers.db_pool import DbPool
+from parsers.iss_fixture import IssFixtureServer
+from parsers.migrations import apply_migrations
+from parsers.moex_boards import BoardSpec
+
+TICKERS = ['SBER', 'GAZP']
+START, END = date(2024, 1, 8), date(2024, 1, 9)
+# Минутных свечей в fixtures/iss за период: три дня по 520 и один день из 300
+EXPECTED_ROWS = 520 * 3 + 300
+# Строка опроса приложения внутри минуты свечи GAZP 2024-01-08 10:05:59 (время по Москве)
+LIVE_ROW = ('2024-01-08 10:05:17+03', 'GAZP', 161.5, 'TQBR')
+
+
+def admin_execute(params, statement):
+    # CREATE/DROP DATABASE нельзя выполнять в транзакции
+    conn = psycopg2.connect(dbname='postgres', **params)
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(statement)
+    finally:
+        conn.close()
+
+
+class InterruptedFetcher(CandlesFetcher):
+    # Имитация прерванного запуска: свечи GAZP не загружаются
+    def fetch_day(self, ticker, day):
+        if ticker == 'GAZP':
+            raise RuntimeError('simulated interruption')
+        return super().fetch_day(ticker, day)
+
+
+def counts(db):
+    # Строки цен, дубли по (тикер, время) и по (тикер, минута), минутные свечи агрегатов
+    def work(cursor):
+        cursor.execute("SELECT count(*) FROM tqbr_prices WHERE board = 'TQBR'")
+        rows = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT count(*) FROM (SELECT 1 FROM tqbr_prices WHERE board = 'TQBR' "
+            "GROUP BY ticker, ts HAVING count(*) > 1) duplicates"
+        )
+        duplicates = cursor.fetchone()[0]
+        cursor.execute(
+            "SELECT count(*) FROM (SELECT 1 FROM tqbr_prices WHERE board = 'TQBR' "
+            "GROUP BY ticker, date_trunc('minute', ts) HAVING count(*) > 1) duplicates"
+        )
+        duplicates += cursor.fetchone()[0]
+        cursor.execute("SELECT count(*) FROM tqbr_prices_ohlc_1m WHERE board = 'TQBR'")
+        return rows, duplicates, cursor.fetchone()[0]
+
+    return db.run(work)
+
+
+def run_backfill(db, url, checkpoint_path, fetcher_class=CandlesFetcher):
+    fetcher = fetcher_class(BoardSpec('stock', 'shares', 'TQBR'), 1, url, rate=0, pool_size=2)
+    backfill = Backfill(db, fetcher, Checkpoint(checkpoint_path, 'TQBR', 1),
+                        workers=2, batch_units=1, log=lambda message: None)
+    try:
+        stats = backfill.run(TICKERS, START, END)
+    finally:
+        fetcher.close()
+    stats['requests'] = fetcher.stats['requests']
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline backfill rerun/resume check on recorded ISS fixtures')
+    parser.add_argument('--fixtures', default=os.path.join(ROOT, 'fixtures', 'iss'))
+    parser.add_argument('--keep-db', action='store_true', help='do not drop the temporary database')
+    args = parser.parse_args()
+
+    load_dotenv()
+    params = {
+        'user': os.getenv("DB_USER"),
+        'password': os.getenv("DB_PASSWORD"),
+        'host': os.getenv("DB_HOST", "localhost"),
+        'port': os.getenv("DB_PORT", os.getenv("DB_OS_PORT", "5432")),
+    }
+    dbname = f"moex_backfill_check_{os.getpid()}"
+    admin_execute(params, f"CREATE DATABASE {dbname}")
+
+    work_dir = tempfile.mkdtemp(prefix='moex_backfill_')
+    checkpoint_path = os.path.join(work_dir, 'checkpoint.json')
+    iss = IssFixtureServer(args.fixtures).start()
+    db = DbPool(dbname, params['user'], params['password'], params['host'], params['port'])
+    failures = []
+
+    def expect(condition, message):
+        print(f"{'ok    ' if condition else 'FAILED'} {message}")
+        if not condition:
+            failures.append(message)
+
+    try:
+        apply_migrations(db, log=lambda message: None)
+
+        stats = run_backfill(db, iss.url, checkpoint_path, InterruptedFetcher)
+        rows, duplicates, candles = counts(db)
+        expect(stats['units'] == 2 and stats['errors'] == 2,
+               f"interrupted run: {stats['units']} ticker-days loaded, {stats['errors']} failed")
+        expect(rows == 520 * 2, f"interrupted run: {rows} rows in tqbr_prices")
+        # Дни по 520 свечей читаются двумя страницами
+        expect(stats['requests'] == 4, f"interrupted run: {stats['requests']} ISS requests for 2 two-page days")
+
+        # Пока GAZP не загружен, приложение успело записать одну цену опроса
+        db.run(lambda cursor: cursor.execute(
+            "INSERT INTO tqbr_prices (ts, ticker, price, board) VALUES (%s, %s, %s, %s)", LIVE_ROW))
+
+        stats = run_backfill(db, iss.url, checkpoint_path)
+        rows, duplicates, candles = counts(db)
+        expect(stats['skipped'] == 2 and stats['units'] == 2 and not stats['errors'],
+               f"resume: {stats['skipped']} ticker-days skipped by checkpoint, {stats['units']} loaded")
+        # Свеча минуты с ценой опроса пропущена, строк столько же: 1859 свечей и строка опроса
+        expect(stats['inserted'] == EXPECTED_ROWS - 1040 - 1,
+               f"resume: {stats['inserted']} rows inserted, the live minute skipped")
+        expect(rows == EXPECTED_ROWS and not duplicates,
+               f"resume: {rows} rows (expected {EXPECTED_ROWS}), {duplicates} duplicates")
+        expect(candles == EXPECTED_ROWS, f"resume: {candles} one-minute OHLC candles")
+
+        # Новый checkpoint: все пары загружаются заново, но в БД ничего не добавляется
+        os.remove(checkpoint_path)
+        stats = run_backfill(db, iss.url, checkpoint_path)
+        rows, duplicates, candles = counts(db)
+        expect(stats['units'] == 4 and stats['inserted'] == 0,
+               f"rerun: {stats['units']} ticker-days fetched again, {stats['inserted']} rows inserted")
+        expect(rows == EXPECTED_ROWS and not duplicates and candles == EXPECTED_ROWS,
+               f"rerun: {rows} rows, {duplicates} duplicates, {candles} one-minute OHLC candles")
+        expect(not iss.stats['misses'], f"{iss.stats['hits']} fixture hits, {iss.stats['misses']} misses")
+    finally:
+        db.closeall()
+        iss.stop()
+        if not args.keep_db:
+            admin_execute(params, f"DROP DATABASE {dbname}")
+
+    if failures:
+        sys.exit(1)
+    print("Backfill rerun/resume check passed.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Проверка порядка записи снимков при переполнении очереди записи (PIPELINE_OVERFLOW)
+и локальной очереди SPOOL_PATH, без сети и без БД.
+
+Настоящие PollScheduler, MoexPriceTQBR.update_db / replay_spool и SnapshotSpool;
+подменяется только запись в postgres (persist_snapshots): она запоминает порядок
+снимков и работает медленнее, чем снимки поступают, поэтому очередь переполняется.
+В сценариях с spool в середине прогона БД "недоступна" (OperationalError),
+снимки уходят в spool.
+
+Для каждого сценария проверяется, что снимки записаны строго в порядке времени
+получения, а потерянных снимков ровно столько, сколько выброшено политикой.
+
+Запуск из корня репозитория:
+    python benchmarks/check_eviction_order.py
+При расхождении скрипт печатает FAILED и завершается с кодом 1.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import psycopg2
+
+# Добавляем корень репозитория в путь, чтобы импортировать parsers
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from parsers.log_setup import setup_logging
+from parsers.moex_prices import MoexPriceTQBR
+from parsers.scheduler import PollScheduler
+from parsers.snapshot import PriceSnapshot
+
+
+class RecordingFetcher(MoexPriceTQBR):
+    # MoexPriceTQBR, у которого запись в БД заменена журналом записанных снимков
+
+    def __init__(self, write_seconds, **kwargs):
+        super().__init__(None, None, None, None, None, **kwargs)
+        self.write_seconds = write_seconds
+        self.outage = False
+        self.written = []
+
+    def maintain_partitions(self):
+        self.partitions_checked = datetime.now().date()
+
+    def persist_snapshots(self, batch, *args, **kwargs):
+        time.sleep(self.write_seconds * len(batch))
+        if self.outage:
+            raise psycopg2.OperationalError('simulated outage')
+        plan = []
+        for snapshots in batch:
+            self.written.append(snapshots[self.primary_board].fetched_at)
+            rows = [row for snapshot in snapshots.values() for row in snapshot.to_rows()]
+            plan.append((rows, rows, 0, True, None, None))
+        return plan
+
+
+def run_scenario(policy, spool_path, snapshots, interval, write_seconds, work_dir):
+    fetcher = RecordingFetcher(write_seconds, logfile=os.path.join(work_dir, 'log.txt'), spool_path=spool_path)
+    scheduler = PollScheduler(fetcher, 60, queue_size=2, overflow=policy)
+    scheduler.start()
+    started = datetime(2024, 1, 8, 10, 0).astimezone()
+    for position in range(snapshots):
+        # С spool БД недоступна на второй трети прогона; без spool такие снимки теряются не по политике
+        fetcher.outage = bool(spool_path) and snapshots // 3 <= position < snapshots * 2 // 3
+        snapshot = PriceSnapshot('TQBR', started + timedelta(seconds=position), ['SBER'], [float(position)])
+        scheduler.submit({'TQBR': snapshot})
+        time.sleep(interval)
+    fetcher.outage = False
+    scheduler.stop()
+    if fetcher.spool:
+        # Снимки новее последнего записанного остаются в spool до следующего цикла
+        fetcher.replay_spool()
+        fetcher.spool.close()
+    return fetcher.written, scheduler.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Persist queue overflow and spool replay order check')
+    parser.add_argument('--snapshots', type=int, default=60)
+    parser.add_argument('--interval-ms', type=float, default=5.0, help='delay between submitted snapshots')
+    parser.add_argument('--write-ms', type=float, default=15.0, help='simulated write time per snapshot')
+    args = parser.parse_args()
+
+    # Предупреждения о переполнении очереди в консоль не нужны
+    work_dir = tempfile.mkdtemp(prefix='moex_eviction_')
+    setup_logging(os.path.join(work_dir, 'log.txt'), level='CRITICAL')
+    failures = []
+
+    def expect(condition, message):
+        print(f"{'ok    ' if condition else 'FAILED'} {message}")
+        if not condition:
+            failures.append(message)
+
+    for policy, spooled in (('drop_oldest', True), ('drop_newest', True), ('drop_oldest', False)):
+        spool_path = os.path.join(work_dir, f"{policy}_spool.db") if spooled else None
+        written, stats = run_scenario(policy, spool_path, args.snapshots, args.interval_ms / 1000,
+                                      args.write_ms / 1000, work_dir)
+        scenario = f"{policy}{' + spool' if spooled else ''}"
+        ordered = all(earlier < later for earlier, later in zip(written, written[1:]))
+        expect(ordered, f"{scenario}: {len(written)} snapshots written in order of fetch time")
+        expect(len(written) + stats['dropped'] == args.snapshots,
+               f"{scenario}: {len(written)} written + {stats['dropped']} dropped of {args.snapshots}, "
+               f"{stats['spooled']} evicted to the spool")
+        if policy == 'drop_oldest' and spooled:
+            expect(not stats['dropped'], f"{scenario}: nothing dropped")
+
+    if failures:
+        sys.exit(1)
+    print("Eviction order check passed.")
+
+
+if __name__ == '__main__':
+    main()
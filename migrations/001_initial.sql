@@ -0,0 +1,20 @@
+-- Исходная схема БД (то, что раньше создавал init_db.sql).
+-- IF NOT EXISTS позволяет применить миграцию к уже развернутой БД.
+
+CREATE TABLE IF NOT EXISTS public.null_price_percent_metrics (
+    id SERIAL PRIMARY KEY,
+    calculation_date DATE,
+    calculation_time TIME,
+    percent_null_prices NUMERIC
+);
+
+CREATE TABLE IF NOT EXISTS public.tqbr_prices (
+    id SERIAL PRIMARY KEY,
+    quote_date DATE,
+    quote_time TIME,
+    ticker VARCHAR(255),
+    price NUMERIC
+);
+
+-- Колонка режима торгов для опроса нескольких режимов (BOARDS)
+ALTER TABLE public.tqbr_prices ADD COLUMN IF NOT EXISTS board VARCHAR(16) DEFAULT 'TQBR';
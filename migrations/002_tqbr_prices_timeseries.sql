@@ -0,0 +1,102 @@
+-- Перевод tqbr_prices на схему временного ряда:
+--   одна колонка ts (timestamptz) вместо пары quote_date/quote_time,
+--   индекс (ticker, ts DESC) под панели Grafana,
+--   помесячные партиции по ts (границы месяцев в UTC).
+-- Старые данные переносятся, quote_date + quote_time трактуются как московское время
+-- (так их и показывал дашборд через AT TIME ZONE 'Europe/Moscow').
+
+ALTER TABLE public.tqbr_prices RENAME TO tqbr_prices_legacy;
+ALTER TABLE public.tqbr_prices_legacy RENAME CONSTRAINT tqbr_prices_pkey TO tqbr_prices_legacy_pkey;
+ALTER SEQUENCE IF EXISTS public.tqbr_prices_id_seq RENAME TO tqbr_prices_legacy_id_seq;
+
+CREATE TABLE public.tqbr_prices (
+    id BIGSERIAL,
+    ts TIMESTAMPTZ NOT NULL,
+    ticker VARCHAR(255),
+    price NUMERIC,
+    board VARCHAR(16) DEFAULT 'TQBR',
+    PRIMARY KEY (id, ts)
+) PARTITION BY RANGE (ts);
+
+-- Индекс создается на родительской таблице и автоматически наследуется партициями
+CREATE INDEX tqbr_prices_ticker_ts_idx ON public.tqbr_prices (ticker, ts DESC);
+
+
+-- Создание партиции на месяц, в который попадает month_start.
+-- Имя партиции: tqbr_prices_yYYYYmMM
+CREATE OR REPLACE FUNCTION public.tqbr_prices_ensure_partition(month_start DATE)
+RETURNS VOID AS $$
+DECLARE
+    first_day DATE := date_trunc('month', month_start)::DATE;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS public.%I PARTITION OF public.tqbr_prices '
+        'FOR VALUES FROM (%L) TO (%L)',
+        'tqbr_prices_y' || to_char(first_day, 'YYYY"m"MM'),
+        first_day::TIMESTAMP AT TIME ZONE 'UTC',
+        (first_day + INTERVAL '1 month')::TIMESTAMP AT TIME ZONE 'UTC'
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Обслуживание партиций: создает партиции на текущий и months_ahead следующих месяцев,
+-- удаляет партиции старше retention_months месяцев (0 - хранить все).
+-- Возвращает количество удаленных партиций.
+CREATE OR REPLACE FUNCTION public.tqbr_prices_maintain_partitions(months_ahead INT, retention_months INT)
+RETURNS INT AS $$
+DECLARE
+    current_month DATE := date_trunc('month', now() AT TIME ZONE 'UTC')::DATE;
+    partition_name TEXT;
+    dropped INT := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        PERFORM public.tqbr_prices_ensure_partition((current_month + make_interval(months => i))::DATE);
+    END LOOP;
+
+    IF retention_months > 0 THEN
+        FOR partition_name IN
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = 'tqbr_prices'
+              AND child.relname ~ '^tqbr_prices_y[0-9]{4}m[0-9]{2}$'
+              AND to_date(substr(child.relname, 14), 'YYYY"m"MM')
+                  < current_month - make_interval(months => retention_months)
+        LOOP
+            EXECUTE format('DROP TABLE public.%I', partition_name);
+            dropped := dropped + 1;
+        END LOOP;
+    END IF;
+
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Партиции под весь диапазон старых данных и ближайшие месяцы
+DO $$
+DECLARE
+    first_month DATE;
+BEGIN
+    -- Первый месяц в UTC: ночные московские записи 1-го числа попадают в предыдущий месяц
+    SELECT date_trunc('month', min((quote_date + quote_time) AT TIME ZONE 'Europe/Moscow') AT TIME ZONE 'UTC')::DATE
+    INTO first_month
+    FROM public.tqbr_prices_legacy;
+    IF first_month IS NOT NULL THEN
+        PERFORM public.tqbr_prices_ensure_partition(month_start::DATE)
+        FROM generate_series(first_month, now()::DATE, INTERVAL '1 month') AS month_start;
+    END IF;
+    PERFORM public.tqbr_prices_maintain_partitions(2, 0);
+END;
+$$;
+
+INSERT INTO public.tqbr_prices (ts, ticker, price, board)
+SELECT (quote_date + quote_time) AT TIME ZONE 'Europe/Moscow', ticker, price, COALESCE(board, 'TQBR')
+FROM public.tqbr_prices_legacy
+WHERE quote_date IS NOT NULL AND quote_time IS NOT NULL;
+
+DROP TABLE public.tqbr_prices_legacy;
+
+ANALYZE public.tqbr_prices;
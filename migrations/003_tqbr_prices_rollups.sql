@@ -0,0 +1,57 @@
+-- Агрегаты цен для дашбордов: OHLC свечи по 1 минуте, 1 часу и 1 дню
+-- и последняя цена по каждому тикеру. Обновляются инкрементально
+-- после каждого цикла update_db (см. parsers/rollups.py).
+-- Границы интервалов считаются по московскому времени.
+
+CREATE TABLE public.tqbr_prices_ohlc_1m (
+    bucket TIMESTAMPTZ NOT NULL,
+    board VARCHAR(16) NOT NULL,
+    ticker VARCHAR(255) NOT NULL,
+    open NUMERIC,
+    high NUMERIC,
+    low NUMERIC,
+    close NUMERIC,
+    samples INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (ticker, board, bucket)
+);
+
+CREATE TABLE public.tqbr_prices_ohlc_1h (LIKE public.tqbr_prices_ohlc_1m INCLUDING ALL);
+CREATE TABLE public.tqbr_prices_ohlc_1d (LIKE public.tqbr_prices_ohlc_1m INCLUDING ALL);
+
+CREATE TABLE public.tqbr_last_prices (
+    board VARCHAR(16) NOT NULL,
+    ticker VARCHAR(255) NOT NULL,
+    ts TIMESTAMPTZ NOT NULL,
+    price NUMERIC,
+    PRIMARY KEY (ticker, board)
+);
+
+
+-- Заполнение агрегатов по уже накопленным данным
+INSERT INTO public.tqbr_prices_ohlc_1m (bucket, board, ticker, open, high, low, close, samples)
+SELECT date_trunc('minute', ts, 'Europe/Moscow'), board, ticker,
+       (array_agg(price ORDER BY ts))[1], max(price), min(price),
+       (array_agg(price ORDER BY ts DESC))[1], count(*)
+FROM public.tqbr_prices
+WHERE price IS NOT NULL
+GROUP BY 1, 2, 3;
+
+INSERT INTO public.tqbr_prices_ohlc_1h (bucket, board, ticker, open, high, low, close, samples)
+SELECT date_trunc('hour', bucket, 'Europe/Moscow'), board, ticker,
+       (array_agg(open ORDER BY bucket))[1], max(high), min(low),
+       (array_agg(close ORDER BY bucket DESC))[1], sum(samples)
+FROM public.tqbr_prices_ohlc_1m
+GROUP BY 1, 2, 3;
+
+INSERT INTO public.tqbr_prices_ohlc_1d (bucket, board, ticker, open, high, low, close, samples)
+SELECT date_trunc('day', bucket, 'Europe/Moscow'), board, ticker,
+       (array_agg(open ORDER BY bucket))[1], max(high), min(low),
+       (array_agg(close ORDER BY bucket DESC))[1], sum(samples)
+FROM public.tqbr_prices_ohlc_1h
+GROUP BY 1, 2, 3;
+
+INSERT INTO public.tqbr_last_prices (board, ticker, ts, price)
+SELECT DISTINCT ON (board, ticker) board, ticker, ts, price
+FROM public.tqbr_prices
+WHERE price IS NOT NULL
+ORDER BY board, ticker, ts DESC;
@@ -0,0 +1,373 @@
+import argparse
+import json
+import logging
+import math
+import queue
+import threading
+from collections import deque, namedtuple
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+# Сработавшее правило: что, где, по какой цене и когда
+Alert = namedtuple('Alert', ['rule', 'board', 'ticker', 'price', 'ts', 'message'])
+
+# Правило с тикером "*" применяется ко всем тикерам снимка
+ANY_TICKER = '*'
+
+# Результат check при отсутствии цены: выполнено ли условие, неизвестно,
+# поэтому состояние дедупликации оповещения не меняется
+UNKNOWN = object()
+
+
+class ThresholdRule:
+    """
+    Пороговое правило: цена выше (>) или ниже (<) заданного уровня.
+    Состояние не требуется.
+    """
+
+    def __init__(self, ticker, op, level):
+        if op not in ('>', '<'):
+            raise ValueError(f"Unknown threshold operator '{op}', expected > or <")
+        self.ticker = ticker
+        self.op = op
+        self.level = level
+        self.key = f"{ticker}{op}{level:g}"
+
+    def new_state(self):
+        return None
+
+    def check(self, state, price, ts):
+        if math.isnan(price):
+            return UNKNOWN
+        if self.op == '>' and price > self.level:
+            return f"price {price:g} above {self.level:g}"
+        if self.op == '<' and price < self.level:
+            return f"price {price:g} below {self.level:g}"
+        return None
+
+
+class MoveRule:
+    """
+    Правило движения цены: изменение не меньше percent процентов
+    от минимума или максимума за последние window_minutes минут.
+
+    Минимум и максимум окна держатся в монотонных очередях (deque):
+    каждая цена добавляется и удаляется из очереди не более одного раза,
+    поэтому обновление стоит O(1) в среднем независимо от длины окна.
+    """
+
+    def __init__(self, ticker, percent, window_minutes):
+        self.ticker = ticker
+        self.percent = percent
+        # Окно в секундах: правила работают с временем снимка в виде timestamp
+        self.window = window_minutes * 60
+        self.key = f"{ticker} move {percent:g}/{window_minutes:g}"
+
+    def new_state(self):
+        # (минимумы окна по возрастанию, максимумы окна по убыванию), элементы - (ts, цена)
+        return deque(), deque()
+
+    def check(self, state, price, ts):
+        if math.isnan(price):
+            return UNKNOWN
+        lows, highs = state
+        # Новая цена вытесняет из хвоста все значения, которые уже не станут экстремумом окна
+        while lows and lows[-1][1] >= price:
+            lows.pop()
+        lows.append((ts, price))
+        while highs and highs[-1][1] <= price:
+            highs.pop()
+        highs.append((ts, price))
+        # Из головы уходят значения, выпавшие из окна
+        start = ts - self.window
+        while lows[0][0] < start:
+            lows.popleft()
+        while highs[0][0] < start:
+            highs.popleft()
+
+        low, high = lows[0][1], highs[0][1]
+        if low > 0 and (price - low) / low * 100 >= self.percent:
+            return f"up {(price - low) / low * 100:.2f}% from {low:g} within {timedelta(seconds=self.window)}"
+        if high > 0 and (high - price) / high * 100 >= self.percent:
+            return f"down {(high - price) / high * 100:.2f}% from {high:g} within {timedelta(seconds=self.window)}"
+        return None
+
+
+class StaleRule:
+    """
+    Правило устаревания: цена не менялась (или отсутствовала)
+    не меньше minutes минут. Состояние - последняя цена и timestamp ее изменения.
+    """
+
+    def __init__(self, ticker, minutes):
+        self.ticker = ticker
+        self.minutes = minutes
+        self.age = minutes * 60
+        self.key = f"{ticker} stale {minutes:g}"
+
+    def new_state(self):
+        # [последняя цена, время последнего изменения]
+        return [math.nan, None]
+
+    def check(self, state, price, ts):
+        last_price, changed_at = state
+        # NaN != NaN, поэтому отсутствие цены подряд сравниваем отдельно
+        unchanged = price == last_price or (math.isnan(price) and math.isnan(last_price))
+        if changed_at is None or not unchanged:
+            state[0], state[1] = price, ts
+            return None
+        if ts - changed_at >= self.age:
+            since = datetime.fromtimestamp(changed_at).strftime('%H:%M')
+            return f"price {'missing' if math.isnan(price) else format(price, 'g')} unchanged since {since}"
+        return None
+
+
+def parse_alert_rules(value):
+    """
+    Разбирает строку правил, разделенных ';':
+        SBER>300            цена выше уровня
+        GAZP<120            цена ниже уровня
+        SBER move 2/15      движение на 2% и больше за 15 минут
+        * stale 30          цена любого тикера не менялась 30 минут
+    """
+    rules = []
+    for item in value.split(';'):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split()
+        if len(parts) == 1:
+            for op in ('>', '<'):
+                ticker, found, level = item.partition(op)
+                if found:
+                    rules.append(ThresholdRule(ticker.strip(), op, float(level)))
+                    break
+            else:
+                raise ValueError(f"Alert rule '{item}' must look like TICKER>LEVEL or TICKER<LEVEL")
+        elif len(parts) == 3 and parts[1] == 'move':
+            percent, _, window = parts[2].partition('/')
+            rules.append(MoveRule(parts[0], float(percent), float(window)))
+        elif len(parts) == 3 and parts[1] == 'stale':
+            rules.append(StaleRule(parts[0], float(parts[2])))
+        else:
+            raise ValueError(f"Unknown alert rule '{item}'")
+    return rules
+
+
+class AlertEngine:
+    """
+    Инкрементальная проверка правил по потоку снимков цен.
+
+    Правила сгруппированы по тикерам, поэтому на каждый снимок проверяются
+    только правила тикеров из снимка, а состояние каждого правила (окно цен,
+    время последнего изменения) обновляется за O(1) без прохода по истории.
+    Состояние хранится отдельно для каждой пары (режим торгов, тикер).
+
+    Оповещения дедуплицируются: правило срабатывает, когда условие становится
+    истинным, и повторно - только после того, как условие снималось,
+    или через repeat_minutes, если условие держится (0 - не повторять).
+
+    evaluate:
+    проверяет снимок, отправляет новые оповещения в sink и возвращает их.
+    """
+
+    def __init__(self, rules, sink=None, repeat_minutes=0):
+        self.by_ticker = {}
+        self.any_ticker = []
+        for rule in rules:
+            if rule.ticker == ANY_TICKER:
+                self.any_ticker.append(rule)
+            else:
+                self.by_ticker.setdefault(rule.ticker, []).append(rule)
+        self.rule_count = len(rules)
+        self.sink = sink
+        self.repeat = repeat_minutes * 60 if repeat_minutes else None
+        # (режим, тикер) -> список [правило, состояние, timestamp последнего оповещения или None]
+        self.states = {}
+        self.stats = {
+            'snapshots': 0,   # проверено снимков
+            'checks': 0,      # проверено пар (правило, тикер)
+            'fired': 0,       # отправлено оповещений
+            'suppressed': 0,  # повторов, подавленных дедупликацией
+        }
+
+    def _entries(self, board, ticker):
+        # Состояния правил тикера создаются при первой встрече тикера
+        entries = self.states.get((board, ticker))
+        if entries is None:
+            rules = self.by_ticker.get(ticker, [])
+            if self.any_ticker:
+                rules = rules + self.any_ticker
+            entries = [[rule, rule.new_state(), None] for rule in rules]
+            self.states[(board, ticker)] = entries
+        return entries
+
+    def evaluate(self, snapshot):
+        alerts = []
+        # Время снимка один раз переводим в секунды: сравнение float дешевле datetime
+        ts = snapshot.fetched_at.timestamp()
+        board = snapshot.board
+        checks = 0
+        # Без правил на все тикеры проверяем только тикеры, для которых правила заданы
+        check_all = bool(self.any_ticker)
+        for ticker, price in zip(snapshot.tickers, snapshot.prices):
+            if not check_all and ticker not in self.by_ticker:
+                continue
+            for entry in self._entries(board, ticker):
+                rule, state, fired_at = entry
+                checks += 1
+                message = rule.check(state, price, ts)
+                if message is UNKNOWN:
+                    # Цены нет: условие не снято, а пропущенная цена не делает следующее срабатывание новым
+                    continue
+                if message is None:
+                    # Условие снято - следующее срабатывание снова будет новым
+                    entry[2] = None
+                    continue
+                if fired_at is not None and (self.repeat is None or ts - fired_at < self.repeat):
+                    self.stats['suppressed'] += 1
+                    continue
+                entry[2] = ts
+                alerts.append(Alert(rule.key, board, ticker, None if math.isnan(price) else price,
+                                    snapshot.fetched_at, message))
+
+        self.stats['snapshots'] += 1
+        self.stats['checks'] += checks
+        self.stats['fired'] += len(alerts)
+        if alerts and self.sink:
+            self.sink.send(alerts)
+        return alerts
+
+
+class LogSink:
+    """
+    Получатель оповещений, который пишет их в лог приложения
+    (log_message из MoexPriceTQBR или любая функция с той же сигнатурой).
+    """
+
+    def __init__(self, log):
+        self.log = log
+
+    def send(self, alerts):
+        for alert in alerts:
+            self.log(f"ALERT {alert.board}:{alert.ticker} [{alert.rule}] {alert.message}",
+                     level=logging.WARNING, alert=alert_payload(alert))
+
+
+class WebhookSink:
+    """
+    Получатель оповещений, который отправляет их POST-запросом с JSON
+    на url. Отправка идет в фоновом потоке через очередь, поэтому медленный
+    или недоступный webhook не задерживает цикл опроса.
+    Ошибки отправки передаются в on_error (например, log_message).
+    """
+
+    def __init__(self, url, timeout=5, on_error=None):
+        self.url = url
+        self.timeout = timeout
+        self.on_error = on_error
+        self.session = requests.Session()
+        self.queue = queue.Queue()
+        self.stats = {'sent': 0, 'errors': 0}
+        self.worker = threading.Thread(target=self._send_loop, name='alerts-webhook', daemon=True)
+        self.worker.start()
+
+    def send(self, alerts):
+        self.queue.put([alert_payload(alert) for alert in alerts])
+
+    def _send_loop(self):
+        while True:
+            payload = self.queue.get()
+            try:
+                if payload is None:
+                    return
+                response = self.session.post(self.url, json={'alerts': payload}, timeout=self.timeout)
+                response.raise_for_status()
+                self.stats['sent'] += len(payload)
+            except Exception as e:
+                self.stats['errors'] += 1
+                if self.on_error:
+                    self.on_error(f"Error sending alerts to webhook: {e}", level=logging.ERROR)
+            finally:
+                self.queue.task_done()
+
+    def close(self):
+        # Дожидаемся отправки оставшихся оповещений
+        self.queue.put(None)
+        self.worker.join()
+        self.session.close()
+
+
+class MultiSink:
+    # Рассылка оповещений сразу в несколько получателей
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def send(self, alerts):
+        for sink in self.sinks:
+            sink.send(alerts)
+
+
+def alert_payload(alert):
+    # Оповещение в виде словаря для JSON
+    return {
+        'rule': alert.rule,
+        'board': alert.board,
+        'ticker': alert.ticker,
+        'price': alert.price,
+        'ts': alert.ts.isoformat(),
+        'message': alert.message,
+    }
+
+
+class LocalWebhook:
+    """
+    Локальная замена внешнего webhook для проверок и бенчмарков:
+    HTTP-сервер на 127.0.0.1, который принимает POST с оповещениями
+    и складывает их в список received. port=0 - любой свободный порт.
+    """
+
+    def __init__(self, port=0, echo=False):
+        received = self.received = []
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                alerts = json.loads(body).get('alerts', [])
+                received.extend(alerts)
+                if echo:
+                    for alert in alerts:
+                        print(json.dumps(alert, ensure_ascii=False), flush=True)
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/alerts"
+        self.thread = threading.Thread(target=self.server.serve_forever, name='local-webhook', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    # Запуск локального webhook: python -m parsers.alerts --port 8099
+    parser = argparse.ArgumentParser(description='Local webhook that prints received alerts')
+    parser.add_argument('--port', type=int, default=8099)
+    args = parser.parse_args()
+    webhook = LocalWebhook(args.port, echo=True)
+    print(f"Listening on {webhook.url}", flush=True)
+    webhook.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
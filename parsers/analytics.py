@@ -0,0 +1,155 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Итог анализа одного снимка относительно предыдущего снимка того же режима
+SnapshotStats = namedtuple('SnapshotStats', [
+    'board', 'total', 'null_ratio', 'advancers', 'decliners', 'unchanged', 'outliers'
+])
+
+
+class TickerIndex:
+    """
+    Словарное кодирование тикеров: каждый тикер получает постоянный
+    целочисленный id на время работы процесса. Снимки разных циклов
+    сопоставляются по id векторно, без словарей на каждую строку.
+
+    ISS возвращает тикеры в одном и том же порядке, поэтому последний
+    закодированный список кешируется и повторно не перебирается.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.tickers = []
+        self._last_tickers = None
+        self._last_ids = None
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def encode(self, tickers):
+        # Сравнение кортежей идет на уровне C и намного дешевле поиска в словаре на каждый тикер
+        if tickers == self._last_tickers:
+            return self._last_ids
+        ids = np.empty(len(tickers), dtype=np.int32)
+        for position, ticker in enumerate(tickers):
+            ticker_id = self.ids.get(ticker)
+            if ticker_id is None:
+                ticker_id = self.ids[ticker] = len(self.tickers)
+                self.tickers.append(ticker)
+            ids[position] = ticker_id
+        self._last_tickers, self._last_ids = tickers, ids
+        return ids
+
+    def decode(self, ids):
+        return [self.tickers[ticker_id] for ticker_id in ids]
+
+
+class ColumnarSnapshot:
+    """
+    Колоночное представление PriceSnapshot: id тикеров (int32),
+    цены float64 и маска valid (цена есть). Цены не копируются:
+    массив NumPy смотрит в буфер array('d') исходного снимка.
+    """
+
+    __slots__ = ('board', 'fetched_at', 'ids', 'prices', 'valid')
+
+    def __init__(self, board, fetched_at, ids, prices):
+        self.board = board
+        self.fetched_at = fetched_at
+        self.ids = ids
+        self.prices = prices
+        self.valid = ~np.isnan(prices)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, index):
+        # Снимок не меняется после создания, поэтому буфер array('d') можно разделять
+        prices = np.frombuffer(snapshot.prices, dtype=np.float64)
+        return cls(snapshot.board, snapshot.fetched_at, index.encode(snapshot.tickers), prices)
+
+    def __len__(self):
+        return len(self.prices)
+
+
+def null_ratio(snapshot):
+    # Доля тикеров без цены, от 0 до 1
+    total = len(snapshot)
+    return float(total - np.count_nonzero(snapshot.valid)) / total if total else 0.0
+
+
+def returns(previous, current, size):
+    """
+    Доходность каждого тикера current относительно previous (цена / прежняя цена - 1).
+    Снимки выравниваются по id тикеров через плотный массив размера size
+    (число тикеров в TickerIndex). NaN - цены нет в одном из снимков.
+    """
+    previous_prices = np.full(size, np.nan)
+    previous_prices[previous.ids] = previous.prices
+    base = previous_prices[current.ids]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        result = current.prices / base - 1.0
+    # Нулевая прежняя цена дает inf - такие доходности не учитываем
+    result[~np.isfinite(result)] = np.nan
+    return result
+
+
+def breadth(changes):
+    # Ширина рынка: (выросли, упали, не изменились) среди тикеров с известной доходностью
+    known = changes[~np.isnan(changes)]
+    advancers = int(np.count_nonzero(known > 0))
+    decliners = int(np.count_nonzero(known < 0))
+    return advancers, decliners, len(known) - advancers - decliners
+
+
+def zscore_outliers(changes, threshold=3.0):
+    """
+    Позиции и z-оценки доходностей, отклоняющихся от среднего по рынку
+    больше чем на threshold стандартных отклонений.
+    """
+    known = ~np.isnan(changes)
+    if np.count_nonzero(known) < 2:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    values = changes[known]
+    std = values.std()
+    if std == 0:
+        return np.empty(0, dtype=np.intp), np.empty(0)
+    scores = np.full(len(changes), np.nan)
+    scores[known] = (values - values.mean()) / std
+    with np.errstate(invalid='ignore'):
+        positions = np.flatnonzero(np.abs(scores) > threshold)
+    return positions, scores[positions]
+
+
+class SnapshotAnalytics:
+    """
+    Векторная аналитика по потоку снимков: хранит общий TickerIndex
+    и предыдущий колоночный снимок каждого режима торгов.
+
+    update:
+    переводит снимок в колоночный вид, считает долю Null, ширину рынка
+    и выбросы по z-оценке доходности относительно предыдущего снимка.
+    """
+
+    def __init__(self, outlier_threshold=3.0):
+        self.index = TickerIndex()
+        self.outlier_threshold = outlier_threshold
+        self.previous = {}
+
+    def update(self, snapshot):
+        current = ColumnarSnapshot.from_snapshot(snapshot, self.index)
+        previous = self.previous.get(snapshot.board)
+        self.previous[snapshot.board] = current
+
+        advancers = decliners = unchanged = 0
+        outliers = []
+        if previous is not None and len(current):
+            changes = returns(previous, current, len(self.index))
+            advancers, decliners, unchanged = breadth(changes)
+            positions, scores = zscore_outliers(changes, self.outlier_threshold)
+            # Выбросов мало, поэтому их раскодируем обычным циклом
+            outliers = [
+                (self.index.tickers[current.ids[position]], float(changes[position]), float(score))
+                for position, score in zip(positions, scores)
+            ]
+        return SnapshotStats(snapshot.board, len(current), null_ratio(current),
+                             advancers, decliners, unchanged, outliers)
@@ -0,0 +1,302 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from parsers.moex_boards import ISS_URL
+from parsers.rollups import rebuild_rollups
+from parsers.scheduler import MSK
+
+# Размер страницы свечей в ответе ISS: если строк меньше, страница последняя
+ISS_PAGE_SIZE = 500
+
+# Промежуточная таблица загрузки: живет до конца сессии, очищается после каждого commit
+STAGE_TABLE = """
+CREATE TEMP TABLE IF NOT EXISTS backfill_stage (
+    ts TIMESTAMPTZ NOT NULL,
+    ticker VARCHAR(255) NOT NULL,
+    price NUMERIC,
+    board VARCHAR(16) NOT NULL
+) ON COMMIT DELETE ROWS;
+"""
+
+# Свеча вставляется, только если в ее минуте у тикера и режима еще нет ни одной строки.
+# Живые опросы пишут время получения снимка, которое не совпадает со временем окончания
+# свечи, поэтому сравнение идет по минуте, а не по точному ts: минуты, где уже есть данные
+# опроса, не уплотняются свечами, а повторный запуск за тот же период не создает дублей.
+# Поиск идет по индексу (ticker, ts DESC) диапазоном внутри минуты
+STAGE_MERGE = """
+INSERT INTO public.tqbr_prices (ts, ticker, price, board)
+SELECT DISTINCT ON (s.ticker, s.ts) s.ts, s.ticker, s.price, s.board
+FROM backfill_stage s
+WHERE NOT EXISTS (
+    SELECT 1 FROM public.tqbr_prices p
+    WHERE p.ticker = s.ticker AND p.board = s.board
+      AND p.ts >= date_trunc('minute', s.ts)
+      AND p.ts < date_trunc('minute', s.ts) + INTERVAL '1 minute'
+)
+ORDER BY s.ticker, s.ts;
+"""
+
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def days_between(start, end):
+    # Все календарные дни от start до end включительно
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+
+class RateLimiter:
+    """
+    Общий для всех потоков ограничитель частоты запросов:
+    не больше rate запросов в секунду (0 - без ограничения).
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._lock = threading.Lock()
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class CandlesFetcher:
+    """
+    Загрузка свечей ISS по одному тикеру за один день с постраничным чтением.
+
+    fetch_day:
+    возвращает строки (ts, ticker, close, board) за день; ts - время окончания свечи.
+    """
+
+    def __init__(self, spec, interval=1, base_url=ISS_URL, timeout=(5, 30), rate=10, pool_size=8, retries=3):
+        self.spec = spec
+        self.interval = interval
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.retries = retries
+        self.limiter = RateLimiter(rate)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.stats = {'requests': 0, 'retries': 0, 'candles': 0}
+
+    def fetch_page(self, ticker, day, start):
+        spec = self.spec
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            try:
+                self.stats['requests'] += 1
+                response = self.session.get(
+                    f'{self.base_url}/engines/{spec.engine}/markets/{spec.market}/boards/{spec.board}'
+                    f'/securities/{ticker}/candles.json',
+                    params={
+                        'iss.meta': 'off',              # Отключение метаданных в ответе
+                        'iss.only': 'candles',          # Только блок свечей
+                        'candles.columns': 'end,close', # Время окончания свечи и цена закрытия
+                        'from': day.isoformat(),
+                        'till': day.isoformat(),
+                        'interval': self.interval,
+                        'start': start,
+                    },
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                return response.json()['candles']['data']
+            except requests.RequestException as e:
+                # Ответы 4xx повторять бессмысленно, повторяем только сбои сети и 5xx
+                client_error = e.response is not None and e.response.status_code < 500
+                if attempt == self.retries or client_error:
+                    raise
+                self.stats['retries'] += 1
+                time.sleep(min(2 ** attempt, 30))
+
+    def fetch_day(self, ticker, day):
+        rows = []
+        start = 0
+        while True:
+            page = self.fetch_page(ticker, day, start)
+            for end, close in page:
+                # ISS отдает время по Москве без часового пояса
+                ts = datetime.strptime(end, '%Y-%m-%d %H:%M:%S').replace(tzinfo=MSK)
+                rows.append((ts, ticker, close, self.spec.board))
+            if len(page) < ISS_PAGE_SIZE:
+                break
+            start += len(page)
+        self.stats['candles'] += len(rows)
+        return rows
+
+    def close(self):
+        self.session.close()
+
+
+class Checkpoint:
+    """
+    Файл с уже загруженными в БД парами (тикер, день).
+    Пара попадает в файл только после commit, файл перезаписывается атомарно,
+    поэтому после падения загрузка продолжается с того же места.
+    Ключ учитывает режим торгов и интервал свечей.
+    """
+
+    def __init__(self, path, board, interval):
+        self.path = path
+        self.prefix = f"{board}:{interval}:"
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as checkpoint_file:
+                self.done = set(json.load(checkpoint_file).get('done', []))
+
+    def key(self, ticker, day):
+        return f"{self.prefix}{ticker}:{day.isoformat()}"
+
+    def is_done(self, ticker, day):
+        return self.key(ticker, day) in self.done
+
+    def mark(self, units):
+        self.done.update(self.key(ticker, day) for ticker, day in units)
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as checkpoint_file:
+                json.dump({'done': sorted(self.done)}, checkpoint_file)
+            os.replace(tmp_path, self.path)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+
+class Backfill:
+    """
+    Историческая загрузка цен в tqbr_prices по свечам ISS.
+
+    Пары (тикер, день) запрашиваются параллельно в workers потоках с общим
+    ограничением частоты запросов. Готовые пары копятся в пачку и загружаются
+    через COPY во временную таблицу, откуда в tqbr_prices попадают только
+    свечи минут без данных (см. STAGE_MERGE); в той же транзакции
+    пересчитываются OHLC агрегаты.
+    После commit пары отмечаются в checkpoint.
+
+    run:
+    загружает период и возвращает статистику, включая ticker-days в секунду.
+    """
+
+    def __init__(self, db, fetcher, checkpoint, workers=8, batch_units=50, log=print):
+        self.db = db
+        self.fetcher = fetcher
+        self.checkpoint = checkpoint
+        self.workers = workers
+        self.batch_units = batch_units
+        self.log = log
+        self.stats = {'units': 0, 'skipped': 0, 'rows': 0, 'inserted': 0, 'errors': 0}
+
+    def ensure_partitions(self, start, end):
+        # Партиции помесячные в UTC, а московские сутки начинаются накануне в 21:00 UTC
+        months = sorted({date(day.year, day.month, 1) for day in days_between(start - timedelta(days=1), end)})
+
+        def work(cursor):
+            for month in months:
+                cursor.execute("SELECT tqbr_prices_ensure_partition(%s)", (month,))
+
+        self.db.run(work)
+
+    def load(self, units, rows):
+        """
+        Загрузка пачки строк одной транзакцией, возвращает число вставленных строк.
+        """
+        if not rows:
+            return 0
+        buffer = io.StringIO()
+        for ts, ticker, price, board in rows:
+            value = '\\N' if price is None else repr(price)
+            buffer.write(f"{ts.isoformat()}\t{ticker}\t{value}\t{board}\n")
+        tickers = sorted({ticker for ticker, _ in units})
+        start = min(ts for ts, _, _, _ in rows)
+        end = max(ts for ts, _, _, _ in rows) + timedelta(microseconds=1)
+        inserted = []
+
+        def work(cursor):
+            buffer.seek(0)
+            cursor.execute(STAGE_TABLE)
+            cursor.copy_expert("COPY backfill_stage (ts, ticker, price, board) FROM STDIN", buffer)
+            cursor.execute(STAGE_MERGE)
+            inserted.append(cursor.rowcount)
+            rebuild_rollups(cursor, self.fetcher.spec.board, tickers, start, end)
+
+        self.db.run(work)
+        return inserted[-1]
+
+    def flush(self, units, rows):
+        inserted = self.load(units, rows)
+        self.checkpoint.mark(units)
+        self.stats['units'] += len(units)
+        self.stats['rows'] += len(rows)
+        self.stats['inserted'] += inserted
+
+    def run(self, tickers, start, end):
+        self.ensure_partitions(start, end)
+        pending = []
+        for ticker in tickers:
+            for day in days_between(start, end):
+                if self.checkpoint.is_done(ticker, day):
+                    self.stats['skipped'] += 1
+                else:
+                    pending.append((ticker, day))
+        self.log(f"Backfill {len(tickers)} tickers, {start}..{end}: "
+                 f"{len(pending)} ticker-days to load, {self.stats['skipped']} already done.")
+
+        started = time.perf_counter()
+        batch_units, batch_rows = [], []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # В работе держим ограниченное число задач, чтобы не держать весь период в памяти
+            queue = iter(pending)
+            futures = {}
+            for unit in queue:
+                futures[executor.submit(self.fetcher.fetch_day, *unit)] = unit
+                if len(futures) >= self.workers * 2:
+                    break
+            while futures:
+                completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    unit = futures.pop(future)
+                    try:
+                        batch_rows.extend(future.result())
+                        batch_units.append(unit)
+                    except Exception as e:
+                        # Неудачная пара не отмечается в checkpoint и будет загружена при следующем запуске
+                        self.stats['errors'] += 1
+                        self.log(f"Error fetching {unit[0]} {unit[1]}: {e}")
+                    next_unit = next(queue, None)
+                    if next_unit is not None:
+                        futures[executor.submit(self.fetcher.fetch_day, *next_unit)] = next_unit
+                if len(batch_units) >= self.batch_units:
+                    self.flush(batch_units, batch_rows)
+                    batch_units, batch_rows = [], []
+                    elapsed = time.perf_counter() - started
+                    self.log(f"Loaded {self.stats['units']}/{len(pending)} ticker-days, "
+                             f"{self.stats['units'] / elapsed:.1f} ticker-days/sec.")
+        if batch_units:
+            self.flush(batch_units, batch_rows)
+
+        elapsed = time.perf_counter() - started
+        self.stats['seconds'] = elapsed
+        self.stats['ticker_days_per_sec'] = self.stats['units'] / elapsed if elapsed else 0.0
+        return self.stats
@@ -0,0 +1,143 @@
+import threading
+from time import perf_counter
+
+import psycopg2
+
+
+class DbPool:
+    """
+    Пул постоянных соединений с postgres, которым владеет MoexPriceTQBR.
+
+    Соединения открываются лениво и после успешной транзакции возвращаются
+    в пул, поэтому TCP-подключение и авторизация выполняются один раз,
+    а не на каждом цикле опроса.
+
+    run:
+    выполняет переданную функцию в одной транзакции. Если соединение
+    оказалось разорванным (рестарт БД, обрыв сети), оно выбрасывается,
+    открывается новое и транзакция повторяется.
+
+    stats:
+    счетчики подключений, переиспользований, переподключений
+    и времени установки соединения.
+    """
+
+    # Ошибки, после которых соединение считается испорченным и подлежит замене
+    CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+
+    def __init__(self, dbname, user, password, host, port, maxconn=2):
+        self.dbname = dbname
+        self.user = user
+        self.password = password
+        self.host = host
+        self.port = port
+        self.maxconn = maxconn
+        self._idle = []  # свободные соединения, готовые к повторному использованию
+        self._lock = threading.Lock()
+        self._stats = {
+            'connects': 0,              # сколько раз открывалось новое соединение
+            'connect_errors': 0,        # неудачные попытки подключения
+            'connect_seconds_total': 0.0,
+            'connect_seconds_last': 0.0,
+            'reuses': 0,                # сколько раз соединение взято из пула повторно
+            'reconnects': 0,            # сколько раз соединение выброшено после ошибки
+        }
+
+    def _connect(self):
+        # Открываем новое соединение и замеряем время подключения
+        started = perf_counter()
+        try:
+            conn = psycopg2.connect(
+                dbname=self.dbname,
+                user=self.user,
+                password=self.password,
+                host=self.host,
+                port=self.port,
+                # Миграции и логи содержат кириллицу, кодировку клиента задаем явно
+                client_encoding='UTF8'
+            )
+        except Exception:
+            with self._lock:
+                self._stats['connect_errors'] += 1
+            raise
+        elapsed = perf_counter() - started
+        with self._lock:
+            self._stats['connects'] += 1
+            self._stats['connect_seconds_total'] += elapsed
+            self._stats['connect_seconds_last'] = elapsed
+        return conn
+
+    def getconn(self):
+        # Берем свободное соединение из пула, закрытые выбрасываем
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.closed:
+                    self._stats['reuses'] += 1
+                    return conn
+        # Свободных нет - открываем новое
+        return self._connect()
+
+    def putconn(self, conn, broken=False):
+        # Возвращаем соединение в пул; испорченные и лишние закрываем
+        with self._lock:
+            if not broken and not conn.closed and len(self._idle) < self.maxconn:
+                self._idle.append(conn)
+                return
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def run(self, work, retries=1):
+        """
+        Выполняет work(cursor) в одной транзакции и возвращает ее результат.
+        При обрыве соединения повторяет транзакцию на новом соединении
+        не более retries раз, остальные ошибки пробрасываются после rollback.
+        """
+        attempt = 0
+        while True:
+            conn = self.getconn()
+            try:
+                with conn.cursor() as cursor:
+                    result = work(cursor)
+                conn.commit()
+            except self.CONNECTION_ERRORS:
+                # Соединение испорчено: выбрасываем его и, если можно, повторяем
+                self.putconn(conn, broken=True)
+                with self._lock:
+                    self._stats['reconnects'] += 1
+                if attempt >= retries:
+                    raise
+                attempt += 1
+                continue
+            except Exception:
+                # Ошибка в самом запросе: откатываем транзакцию, соединение оставляем
+                conn.rollback()
+                self.putconn(conn)
+                raise
+            self.putconn(conn)
+            return result
+
+    def ping(self):
+        # Проверка доступности БД; соединение остается в пуле для следующего цикла
+        self.run(lambda cursor: cursor.execute("SELECT 1"))
+
+    def stats(self):
+        # Копия счетчиков и средняя задержка подключения в миллисекундах
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = len(self._idle)
+        connects = stats['connects']
+        stats['connect_ms_avg'] = stats['connect_seconds_total'] * 1000 / connects if connects else 0.0
+        return stats
+
+    def closeall(self):
+        # Закрываем все свободные соединения (при остановке приложения)
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
@@ -0,0 +1,194 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+
+from parsers.moex_boards import ISS_URL
+
+
+def fixture_key(path, query):
+    # Имя файла ответа: хеш пути и отсортированных параметров запроса
+    canonical = path + '?' + urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+class IssFixtureServer:
+    """
+    Локальный HTTP-сервер с записанными ответами ISS для проверок без сети.
+
+    В режиме записи (record_url) запрос проксируется в настоящий ISS,
+    ответ сохраняется в directory и отдается клиенту. В режиме воспроизведения
+    ответ берется из directory; если записи нет, возвращается 404.
+    Адрес для клиентов - self.url (подставляется вместо http://iss.moex.com/iss).
+    """
+
+    def __init__(self, directory, port=0, record_url=None):
+        self.directory = directory
+        self.record_url = record_url.rstrip('/') if record_url else None
+        self.stats = {'hits': 0, 'misses': 0, 'recorded': 0}
+        os.makedirs(directory, exist_ok=True)
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                # Путь хранится относительно корня ISS, без префикса /iss
+                path = parts.path[len('/iss'):] if parts.path.startswith('/iss/') else parts.path
+                status, body = server.lookup(path, parts.query)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/iss"
+        self.thread = threading.Thread(target=self.server.serve_forever, name='iss-fixture', daemon=True)
+
+    def lookup(self, path, query):
+        file_path = os.path.join(self.directory, fixture_key(path, query) + '.json')
+        if os.path.exists(file_path):
+            with open(file_path, encoding='utf-8') as fixture_file:
+                self.stats['hits'] += 1
+                return 200, json.dumps(json.load(fixture_file)['body']).encode('utf-8')
+        if not self.record_url:
+            self.stats['misses'] += 1
+            return 404, b'{"error": "fixture not recorded"}'
+
+        response = requests.get(f"{self.record_url}{path}", params=parse_qsl(query), timeout=(5, 30))
+        if response.status_code != 200:
+            return response.status_code, response.content
+        with open(file_path, 'w', encoding='utf-8') as fixture_file:
+            # Путь и параметры сохраняются рядом с ответом, чтобы запись можно было прочитать глазами
+            json.dump({'path': path, 'query': query, 'body': response.json()}, fixture_file, ensure_ascii=False)
+        self.stats['recorded'] += 1
+        return 200, response.content
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# Путь запроса маркетдаты режима торгов, как его строит MoexBoardsFetcher.fetch_board
+MARKETDATA_PATH = re.compile(r'^/iss/engines/[^/]+/markets/[^/]+/boards/([^/]+)/securities\.json$')
+
+
+class SyntheticIss:
+    """
+    Заменитель ISS с синтетической маркетдатой для бенчмарков без сети.
+
+    На каждый запрос маркетдаты любого режима возвращает instruments тикеров,
+    цены которых случайно блуждают между запросами; доля null_ratio тикеров
+    без цены. Задержка ответа latency секунд, доля ответов с ошибкой 500 - error_rate.
+    GET /stats отдает счетчики запросов и ошибок в JSON (для запуска в отдельном процессе).
+    """
+
+    def __init__(self, instruments=250, latency=0.0, error_rate=0.0, null_ratio=0.1, port=0, seed=1):
+        self.instruments = instruments
+        self.latency = latency
+        self.error_rate = error_rate
+        self.null_ratio = null_ratio
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._prices = {}
+        self.stats = {'requests': 0, 'errors': 0}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = server.respond(urlsplit(self.path).path)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/iss"
+        self.thread = threading.Thread(target=self.server.serve_forever, name='synthetic-iss', daemon=True)
+
+    def marketdata(self, board):
+        # Следующий шаг случайного блуждания цен режима торгов
+        with self._lock:
+            prices = self._prices.get(board)
+            if prices is None:
+                prices = self._prices[board] = [100 + self._random.random() * 100 for _ in range(self.instruments)]
+            rng = self._random
+            data = []
+            for position in range(self.instruments):
+                prices[position] *= 1 + rng.gauss(0, 0.002)
+                price = None if rng.random() < self.null_ratio else round(prices[position], 4)
+                data.append([f"S{position:05d}", price])
+        return data
+
+    def respond(self, path):
+        if path == '/stats':
+            with self._lock:
+                return 200, json.dumps(self.stats).encode('utf-8')
+        match = MARKETDATA_PATH.match(path)
+        if not match:
+            return 404, b'{"error": "unknown path"}'
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.stats['requests'] += 1
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.stats['errors'] += 1
+        if failed:
+            return 500, b'{"error": "synthetic failure"}'
+        body = {'marketdata': {'columns': ['SECID', 'LAST'], 'data': self.marketdata(match.group(1))}}
+        return 200, json.dumps(body).encode('utf-8')
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    # Запись: python -m parsers.iss_fixture fixtures/iss --record
+    # Воспроизведение: python -m parsers.iss_fixture fixtures/iss --port 8098
+    # Синтетическая маркетдата: python -m parsers.iss_fixture --synthetic 5000 --latency 0.05
+    parser = argparse.ArgumentParser(description='Record/replay fixture server for MOEX ISS')
+    parser.add_argument('directory', nargs='?')
+    parser.add_argument('--port', type=int, default=8098)
+    parser.add_argument('--record', action='store_true', help=f'proxy misses to {ISS_URL} and save them')
+    parser.add_argument('--synthetic', type=int, default=0, help='serve synthetic marketdata with N instruments')
+    parser.add_argument('--latency', type=float, default=0.0, help='synthetic response delay, seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of synthetic responses failing with 500')
+    args = parser.parse_args()
+    if args.synthetic:
+        fixture = SyntheticIss(args.synthetic, args.latency, args.error_rate, port=args.port)
+        print(f"Serving synthetic marketdata for {args.synthetic} instruments at {fixture.url}", flush=True)
+    elif args.directory:
+        fixture = IssFixtureServer(args.directory, args.port, ISS_URL if args.record else None)
+        print(f"Serving {args.directory} at {fixture.url}", flush=True)
+    else:
+        parser.error('directory or --synthetic is required')
+    fixture.server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import atexit
+import json
+import logging
+import queue
+import sys
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Имя логгера приложения, под ним же записи попадают в log.txt
+LOGGER_NAME = 'moex_price_tqbr'
+
+# Стандартные атрибуты LogRecord, которые не выводятся как дополнительные поля
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def to_level(value):
+    # Уровень logging из числа или имени ("DEBUG", "info")
+    if isinstance(value, str):
+        return logging.getLevelName(value.strip().upper())
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись лога в одну строку JSON:
+    время, уровень, логгер, сообщение и все поля, переданные через extra.
+    """
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S"),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class ConsoleFormatter(logging.Formatter):
+    """
+    Форматирует запись для консоли в прежнем виде "[время] moex_price_tqbr сообщение".
+    Пакет цен тикеров выводится одной строкой вида TICKER=PRICE.
+    """
+
+    def format(self, record):
+        current_time = datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S")
+        line = f"[{current_time}] {record.name} {record.getMessage()}"
+        tickers = getattr(record, 'tickers', None)
+        if tickers:
+            line += ' ' + ' '.join(f"{ticker}={price}" for ticker, price in tickers.items())
+        return line
+
+
+class TickerLevelFilter(logging.Filter):
+    """
+    Уровень детализации по тикерам: из поля tickers записи убираются
+    тикеры, для которых уровень записи ниже настроенного.
+    Например, при {'SBER': DEBUG} и уровне по умолчанию WARNING
+    в INFO-записи с ценами останется только SBER.
+    """
+
+    def __init__(self, ticker_levels=None, default_level=logging.INFO):
+        super().__init__()
+        self.ticker_levels = {ticker: to_level(level) for ticker, level in (ticker_levels or {}).items()}
+        self.default_level = to_level(default_level)
+
+    def filter(self, record):
+        tickers = getattr(record, 'tickers', None)
+        if tickers:
+            record.tickers = {
+                ticker: price for ticker, price in tickers.items()
+                if record.levelno >= self.ticker_levels.get(ticker, self.default_level)
+            }
+        return True
+
+
+def parse_ticker_levels(value):
+    # Разбор строки вида "SBER=DEBUG,GAZP=WARNING" в {тикер: уровень}
+    levels = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        ticker, _, level = item.partition('=')
+        levels[ticker.strip()] = to_level(level)
+    return levels
+
+
+def setup_logging(logfile='log.txt', level=logging.INFO, max_bytes=10 * 1024 * 1024, backup_count=5,
+                  ticker_levels=None, ticker_default_level=logging.INFO):
+    """
+    Настраивает логгер приложения: записи складываются в очередь,
+    а фоновый поток QueueListener пишет их в консоль и в файл JSON-строками
+    с ротацией по размеру. Повторный вызов возвращает уже настроенный логгер.
+    """
+    global _listener
+
+    logger = logging.getLogger(LOGGER_NAME)
+    if _listener is not None:
+        return logger
+
+    # Обработчики, которые работают в фоновом потоке
+    file_handler = RotatingFileHandler(logfile, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(JsonFormatter())
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(ConsoleFormatter())
+
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    # При завершении процесса дописываем все, что осталось в очереди
+    atexit.register(stop_logging)
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(TickerLevelFilter(ticker_levels, ticker_default_level))
+    logger.addHandler(queue_handler)
+    logger.setLevel(to_level(level))
+    logger.propagate = False
+    return logger
+
+
+def stop_logging():
+    # Остановка фонового потока с записью оставшихся в очереди сообщений
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
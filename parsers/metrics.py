@@ -0,0 +1,285 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Префикс имен метрик приложения
+PREFIX = 'moex_'
+
+# Границы корзин гистограмм длительности этапов, секунды
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Описание метрик для строк # HELP и # TYPE
+METRIC_HELP = {
+    'stage_seconds': ('histogram', 'Duration of a pipeline stage in seconds'),
+    'cycles_total': ('counter', 'Polling cycles started'),
+    'rows_per_cycle': ('gauge', 'Price rows written to tqbr_prices by the last persisted cycle'),
+    'rows_written_total': ('counter', 'Price rows written to tqbr_prices'),
+    'delta_suppressed_rows_total': ('counter', 'Unchanged price rows skipped by delta mode'),
+    'null_price_percentage': ('gauge', 'Percent of tickers with null price in the last snapshot'),
+    'last_successful_fetch_timestamp_seconds': ('gauge', 'Unix time of the last successful ISS fetch'),
+    'last_successful_persist_timestamp_seconds': ('gauge', 'Unix time of the last successful database write'),
+    'scheduler_lag_seconds': ('gauge', 'Delay of the last poll relative to its scheduled tick'),
+    'fetch_errors_total': ('counter', 'Failed ISS requests per board'),
+    'persist_errors_total': ('counter', 'Failed database writes'),
+    'dropped_snapshots_total': ('counter', 'Snapshots dropped because the persist queue was full'),
+    'persist_queue_size': ('gauge', 'Snapshots waiting for the persist thread'),
+    'spool_depth': ('gauge', 'Snapshots waiting in the local spool'),
+    'spool_replay_rows_per_sec': ('gauge', 'Rows per second written by the last spool replay'),
+    'dead_letter_snapshots_total': ('counter', 'Snapshots moved to the spool dead-letter table after a non-connection error'),
+    'alerts_fired_total': ('counter', 'Alerts sent to sinks'),
+}
+
+
+def _labels_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+
+class Histogram:
+    # Накопительная гистограмма в формате Prometheus: счетчики по корзинам, сумма и количество
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[position] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """
+    Реестр метрик приложения без внешних зависимостей:
+    счетчики, значения (gauge) и гистограммы с метками,
+    выдача в текстовом формате Prometheus.
+
+    observe:
+    добавляет значение в гистограмму.
+
+    timer:
+    контекстный менеджер, замеряет длительность этапа в гистограмме stage_seconds.
+
+    set / inc:
+    задают значение или увеличивают счетчик.
+
+    render:
+    текст для ответа /metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values = {}
+        self.histograms = {}
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - started, stage=stage)
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def render(self):
+        with self._lock:
+            values = sorted(self.values.items())
+            histograms = sorted(
+                (key, list(histogram.counts), histogram.sum, histogram.count, histogram.buckets)
+                for key, histogram in self.histograms.items()
+            )
+        lines = []
+        described = set()
+
+        def describe(name):
+            if name in described:
+                return
+            described.add(name)
+            kind, text = METRIC_HELP.get(name, ('untyped', name))
+            lines.append(f'# HELP {PREFIX}{name} {text}')
+            lines.append(f'# TYPE {PREFIX}{name} {kind}')
+
+        for (name, labels), value in values:
+            describe(name)
+            lines.append(f'{PREFIX}{name}{_labels_text(labels)} {value}')
+        for (name, labels), counts, total, count, buckets in histograms:
+            describe(name)
+            cumulative = 0
+            for bound, bucket_count in zip(buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{PREFIX}{name}_bucket{_labels_text(labels + (("le", f"{bound:g}"),))} {cumulative}')
+            lines.append(f'{PREFIX}{name}_bucket{_labels_text(labels + (("le", "+Inf"),))} {count}')
+            lines.append(f'{PREFIX}{name}_sum{_labels_text(labels)} {total}')
+            lines.append(f'{PREFIX}{name}_count{_labels_text(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Общий реестр приложения, как logging.getLogger - один на процесс
+METRICS = Metrics()
+
+
+class CycleProfiler:
+    """
+    Профилирование следующих N циклов через cProfile по запросу, без перезапуска.
+    cProfile видит только свой поток, поэтому профилируется каждый вызов,
+    обернутый в profile() (опрос и запись в БД), а результаты складываются
+    в один pstats. После N циклов результат пишется в directory/profile_*.prof,
+    текстовая сводка доступна через last_report.
+    """
+
+    def __init__(self, directory='.'):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self.stats = None
+        self.last_report = 'No profile recorded yet.\n'
+        self.last_path = None
+
+    def arm(self, cycles):
+        with self._lock:
+            self.remaining = cycles
+            self.stats = None
+
+    @contextmanager
+    def profile(self):
+        if not self.remaining:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profiler)
+                else:
+                    self.stats.add(profiler)
+
+    def cycle_done(self):
+        # Вызывается после каждого цикла записи; по последнему циклу сохраняем результат
+        with self._lock:
+            if not self.remaining:
+                return
+            self.remaining -= 1
+            if self.remaining or self.stats is None:
+                return
+            stats, self.stats = self.stats, None
+        path = os.path.join(self.directory, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.prof")
+        stats.dump_stats(path)
+        report = io.StringIO()
+        stats.stream = report
+        stats.sort_stats('cumulative').print_stats(30)
+        self.last_path = path
+        self.last_report = f"Saved to {path}\n" + report.getvalue()
+
+
+PROFILER = CycleProfiler()
+
+
+def tracemalloc_report(action, limit=30):
+    # Управление tracemalloc: start, snapshot (топ строк по памяти), stop
+    if action == 'start':
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(25)
+        return 'tracemalloc started\n'
+    if action == 'stop':
+        tracemalloc.stop()
+        return 'tracemalloc stopped\n'
+    if not tracemalloc.is_tracing():
+        return 'tracemalloc is not running, call ?action=start first\n'
+    snapshot = tracemalloc.take_snapshot()
+    path = os.path.join(PROFILER.directory, f"tracemalloc_{datetime.now().strftime('%Y%m%d_%H%M%S')}.snapshot")
+    snapshot.dump(path)
+    current, peak = tracemalloc.get_traced_memory()
+    lines = [f"Saved to {path}", f"current={current / 1024:.1f} KiB peak={peak / 1024:.1f} KiB"]
+    lines += [str(stat) for stat in snapshot.statistics('lineno')[:limit]]
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Встроенный HTTP-сервер метрик.
+
+    GET /metrics                    метрики в текстовом формате Prometheus
+    GET /debug/profile?cycles=N     профилировать следующие N циклов (при debug=True)
+    GET /debug/profile              сводка последнего профиля
+    GET /debug/tracemalloc?action=  start | snapshot | stop (при debug=True)
+    """
+
+    def __init__(self, port, host='0.0.0.0', metrics=METRICS, debug=False, profile_dir='.'):
+        self.metrics = metrics
+        PROFILER.directory = profile_dir
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                query = parse_qs(parts.query)
+                status, body = 200, ''
+                if parts.path == '/metrics':
+                    body = server.metrics.render()
+                elif debug and parts.path == '/debug/profile':
+                    if 'cycles' in query:
+                        cycles = int(query['cycles'][0])
+                        PROFILER.arm(cycles)
+                        body = f'Profiling the next {cycles} cycles\n'
+                    else:
+                        body = PROFILER.last_report
+                elif debug and parts.path == '/debug/tracemalloc':
+                    body = tracemalloc_report(query.get('action', ['snapshot'])[0])
+                else:
+                    status, body = 404, 'Not found\n'
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='metrics', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,70 @@
+import os
+
+# Каталог с SQL-миграциями в корне репозитория: NNN_описание.sql
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+
+def list_migrations(path=MIGRATIONS_DIR):
+    # Список (версия, путь к файлу), отсортированный по номеру миграции
+    files = sorted(name for name in os.listdir(path) if name.endswith('.sql'))
+    return [(name[:-4], os.path.join(path, name)) for name in files]
+
+
+def apply_migrations(pool, path=MIGRATIONS_DIR, log=print):
+    """
+    Применяет к БД еще не примененные миграции из каталога migrations.
+    Каждая миграция выполняется в отдельной транзакции через пул pool (DbPool)
+    и записывается в таблицу schema_migrations. Возвращает список примененных версий.
+    """
+
+    def applied_versions(cursor):
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS public.schema_migrations (
+                version VARCHAR(255) PRIMARY KEY,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+            """
+        )
+        cursor.execute("SELECT version FROM public.schema_migrations;")
+        return {row[0] for row in cursor.fetchall()}
+
+    done = pool.run(applied_versions)
+    applied = []
+    for version, filename in list_migrations(path):
+        if version in done:
+            continue
+        with open(filename, 'r', encoding='utf-8') as f:
+            sql = f.read()
+
+        def work(cursor):
+            cursor.execute(sql)
+            cursor.execute("INSERT INTO public.schema_migrations (version) VALUES (%s);", (version,))
+
+        log(f"Applying migration {version}...")
+        # Повтор при обрыве соединения безопасен: неудачная транзакция откатывается целиком
+        pool.run(work)
+        applied.append(version)
+    return applied
+
+
+def main():
+    # Применение миграций из командной строки: python -m parsers.migrations
+    from dotenv import load_dotenv
+    from parsers.db_pool import DbPool
+
+    load_dotenv()
+    pool = DbPool(
+        os.getenv("DB_NAME"),
+        os.getenv("DB_USER"),
+        os.getenv("DB_PASSWORD"),
+        os.getenv("DB_HOST", "localhost"),
+        os.getenv("DB_PORT", os.getenv("DB_OS_PORT", "5432"))
+    )
+    applied = apply_migrations(pool)
+    print(f"Applied migrations: {', '.join(applied) if applied else 'none'}")
+    pool.closeall()
+
+
+if __name__ == "__main__":
+    main()
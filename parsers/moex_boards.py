@@ -0,0 +1,100 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from parsers.metrics import METRICS
+
+# Адрес ISS API Московской биржи по умолчанию
+ISS_URL = 'http://iss.moex.com/iss'
+
+# Описание одного режима торгов: engine/market/board в терминах ISS
+BoardSpec = namedtuple('BoardSpec', ['engine', 'market', 'board'])
+
+
+def parse_board_specs(value):
+    """
+    Разбирает строку вида "stock/shares/TQBR,stock/shares/TQTF"
+    в список BoardSpec. Пустые элементы пропускаются.
+    """
+    specs = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split('/')
+        if len(parts) != 3:
+            raise ValueError(f"Board spec '{item}' must look like engine/market/board")
+        specs.append(BoardSpec(*parts))
+    return specs
+
+
+class MoexBoardsFetcher:
+    """
+    Параллельный опрос нескольких режимов торгов через ISS API.
+
+    Все запросы идут через одну requests.Session с пулом keep-alive
+    соединений, поэтому TCP-подключение к iss.moex.com переиспользуется
+    между циклами, а режимы торгов опрашиваются одновременно в потоках.
+
+    fetch_board:
+    запрашивает SECID и LAST для одного режима торгов.
+
+    fetch_all:
+    опрашивает все режимы (или переданный список) сразу, возвращает словарь
+    {board: (время получения ответа, данные)} и словарь {board: ошибка}
+    для неудачных запросов.
+    """
+
+    def __init__(self, specs, base_url=ISS_URL, timeout=(5, 15), pool_size=10):
+        self.specs = list(specs)
+        self.base_url = base_url.rstrip('/')
+        # (таймаут подключения, таймаут чтения) для каждого запроса
+        self.timeout = timeout
+        self.session = requests.Session()
+        # Пул keep-alive соединений не меньше числа одновременно опрашиваемых режимов
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, len(self.specs)))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=max(1, len(self.specs)))
+
+    def fetch_board(self, spec):
+        # Запрос маркетдаты одного режима торгов; этапы запроса и разбора JSON замеряются отдельно
+        with METRICS.timer('http_fetch'):
+            response = self.session.get(
+                f'{self.base_url}/engines/{spec.engine}/markets/{spec.market}/boards/{spec.board}/securities.json',
+                params={
+                    'iss.meta': 'off',        # Отключение метаданных в ответе
+                    'iss.only': 'marketdata', # Получение только данных рынка
+                    'marketdata.columns': 'SECID,LAST' # Идентификатор ценной бумаги и последняя цена
+                },
+                timeout=self.timeout
+            )
+        # Проверка на ошибки HTTP в ответе
+        response.raise_for_status()
+        with METRICS.timer('json_decode'):
+            return response.json()['marketdata']['data']
+
+    def fetch_stamped(self, spec):
+        # Данные режима вместе со временем получения ответа: режимы отвечают (и повторяются) в разное время
+        data = self.fetch_board(spec)
+        return datetime.now().astimezone(), data
+
+    def fetch_all(self, specs=None):
+        # Запускаем запросы по всем (или только переданным) режимам одновременно и собираем результаты
+        specs = self.specs if specs is None else specs
+        futures = {spec.board: self.executor.submit(self.fetch_stamped, spec) for spec in specs}
+        results, errors = {}, {}
+        for board, future in futures.items():
+            try:
+                results[board] = future.result()
+            except Exception as e:
+                errors[board] = e
+        return results, errors
+
+    def close(self):
+        # Останавливаем потоки и закрываем keep-alive соединения
+        self.executor.shutdown(wait=False)
+        self.session.close()
@@ -1,9 +1,25 @@
-import requests
-import psycopg2
-import sys
-import json
+from psycopg2.extras import execute_values
+import io
 from datetime import datetime
-import os
+from time import perf_counter, sleep
+import logging
+
+from parsers.db_pool import DbPool
+from parsers.moex_boards import BoardSpec, MoexBoardsFetcher, ISS_URL
+from parsers.price_delta import PriceDeltaFilter
+from parsers.rollups import update_rollups
+from parsers.log_setup import setup_logging
+from parsers.snapshot import PriceSnapshot, write_json_atomic
+from parsers.spool import SnapshotSpool, snapshot_time
+from parsers.alerts import AlertEngine, LogSink, MultiSink, WebhookSink
+from parsers.analytics import SnapshotAnalytics
+from parsers.metrics import METRICS
+
+# Допустимые режимы записи цен в БД (см. update_db):
+#   row    - один INSERT на каждый тикер (исходное поведение)
+#   values - пакетный INSERT через psycopg2.extras.execute_values
+#   copy   - потоковая загрузка снимка через COPY FROM STDIN
+WRITE_MODES = ('row', 'values', 'copy')
 
 class MoexPriceTQBR:
     """
@@ -12,199 +28,585 @@ class MoexPriceTQBR:
     параметрами для доступа к базе данных и файлу лога.
 
     log_message: 
-    логирует сообщения, принимая строку сообщения 
-    и записывая его в файл лога с временной меткой.
+    логирует сообщения через стандартный logging: запись уходит в очередь,
+    фоновый поток пишет ее в консоль и JSON-строкой в файл лога с ротацией.
 
     get_prices: 
-    запрашивает данные о котировках 
-    с Московской биржи и сохраняет их как JSON.
+    запрашивает данные о котировках по всем режимам торгов
+    из boards одновременно и возвращает снимки PriceSnapshot по режимам.
+    При заданном json_export основной режим дополнительно сохраняется в JSON.
+    Полученные снимки сразу проверяются правилами оповещений (check_alerts)
+    и анализируются (analyze_snapshots).
+
+    analyze_snapshots:
+    логирует долю Null, ширину рынка и выбросы доходности по каждому режиму.
+
+    check_alerts:
+    проверяет снимки правилами оповещений AlertEngine.
 
     update_db: 
     обновляет базу данных, вставляя 
-    полученные данные о ценах.
+    полученные данные о ценах и процент нулевых цен
+    в одной транзакции. Способ записи цен
+    задается параметром write_mode (row, values, copy).
+    Если БД недоступна, снимок откладывается в локальную очередь spool.
+    При delta_mode=True пишутся только изменившиеся цены.
+    В той же транзакции обновляются OHLC агрегаты для дашбордов.
+
+    persist_snapshots:
+    записывает пачку снимков в одной транзакции.
+
+    replay_spool:
+    выгружает отложенные снимки из локальной очереди в БД.
+
+    maintain_partitions:
+    создает партиции tqbr_prices на ближайшие месяцы
+    и удаляет партиции старше retention_months.
+
+    seed_last_prices:
+    загружает из БД последние цены по тикерам для режима delta.
+
+    write_prices:
+    записывает подготовленные строки цен через переданный
+    курсор выбранным способом, без commit.
 
     show_prices: 
-    читает данные из файла JSON и логирует 
-    информацию о текущих ценах акций.
+    логирует информацию о текущих ценах акций
+    из снимка основного режима торгов.
 
     save_null_prices_percentage_to_db: 
     сохраняет рассчитанный процент нулевых цен в базу данных.
 
     calculate_null_prices_percentage: 
     рассчитывает процент нулевых цен на основе 
-    полученных данных и вызывает метод сохранения в базе данных.
+    полученных данных, при save=True вызывает метод сохранения в базе данных.
+
+    Методы update_db, show_prices и calculate_null_prices_percentage принимают
+    снимки явно; если они не переданы, берутся результаты последнего get_prices.
+
+    Все обращения к БД идут через пул постоянных соединений self.db (DbPool).
     """
 
    
-    def __init__(self, dbname, user, password, host, port, logfile='log.txt'):
+    def __init__(self, dbname, user, password, host, port, logfile='log.txt', write_mode='copy',
+                 boards=None, iss_url=ISS_URL, http_timeout=(5, 15),
+                 delta_mode=False, heartbeat_minutes=0, retention_months=0, json_export=None,
+                 spool_path=None, spool_batch=50, fetch_retries=3, fetch_backoff=1.0,
+                 alert_rules=None, alert_webhook=None, alert_repeat_minutes=0, outlier_zscore=3.0):
+        # Проверяем режим записи сразу, чтобы не узнать об опечатке в .env только на первом цикле
+        if write_mode not in WRITE_MODES:
+            raise ValueError(f"Unknown write_mode '{write_mode}', expected one of {WRITE_MODES}")
         self.dbname = dbname 
         self.user = user 
         self.password = password
         self.host = host
         self.port = port
         self.logfile = logfile
-        self.latest_data = None
+        # Логгер приложения; если app.py уже настроил логирование, используется его настройка
+        self.logger = setup_logging(logfile)
+        self.write_mode = write_mode
+        # Режимы торгов для опроса; первый из них считается основным
+        # (по нему считается процент нулевых цен и выводятся цены)
+        self.boards = boards or [BoardSpec('stock', 'shares', 'TQBR')]
+        self.primary_board = self.boards[0].board
+        self.snapshot = None     # снимок основного режима торгов (PriceSnapshot)
+        self.snapshots = {}      # снимки всех режимов торгов {board: PriceSnapshot}
+        # Путь для необязательной выгрузки основного режима в JSON (None - не выгружать)
+        self.json_export = json_export
+        # HTTP-клиент с keep-alive соединениями для параллельного опроса режимов
+        self.http = MoexBoardsFetcher(self.boards, base_url=iss_url, timeout=http_timeout)
+        # Пул постоянных соединений, общий для записи цен и метрик
+        self.db = DbPool(dbname, user, password, host, port)
+        # Фильтр изменений цен, если включен режим записи только изменений
+        self.delta = PriceDeltaFilter(heartbeat_minutes) if delta_mode else None
+        # Сколько месяцев хранить партиции tqbr_prices (0 - хранить все)
+        # и дата последнего обслуживания партиций
+        self.retention_months = retention_months
+        self.partitions_checked = None
+        # Локальная очередь снимков на время недоступности БД (None - без очереди)
+        self.spool = SnapshotSpool(spool_path) if spool_path else None
+        self.spool_batch = spool_batch
+        # Повторы запроса к MOEX API: число повторов и начальная пауза в секундах
+        self.fetch_retries = fetch_retries
+        self.fetch_backoff = fetch_backoff
+        # Правила оповещений проверяются на каждом снимке; оповещения пишутся в лог
+        # и, если задан alert_webhook, отправляются POST-запросом
+        self.alerts = None
+        if alert_rules:
+            sink = LogSink(self.log_message)
+            if alert_webhook:
+                sink = MultiSink(sink, WebhookSink(alert_webhook, on_error=self.log_message))
+            self.alerts = AlertEngine(alert_rules, sink, repeat_minutes=alert_repeat_minutes)
+        # Векторная аналитика снимков: доля Null, ширина рынка и выбросы доходности
+        self.analytics = SnapshotAnalytics(outlier_zscore)
 
     
-    def log_message(self, message):
+    def log_message(self, message, level=logging.INFO, **fields):
 
         """
         вызываем этот метод когда требуется записать лог
-        в аргументы передается строка, которую нужно записать. 
+        в аргументы передается строка, которую нужно записать,
+        уровень logging и дополнительные поля для JSON-записи.
+        Запись только кладется в очередь, файл пишет фоновый поток.
         """
 
-        # Получение текущего времени и форматирование его для вывода в лог
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-        # Создание записи лога с временем и сообщением, переданным в метод
-        log_entry = f"[{current_time}] moex_price_tqbr {message}"
-
-        # Вывод записи лога в стандартный вывод (консоль)
-        print(log_entry)
-
-        # Открытие файла лога в режиме добавления ('a') и запись туда созданной записи лога
-        with open(self.logfile, "a", encoding='utf-8') as f:
-            # Добавление записи лога в файл и перевод строки для разделения записей
-            f.write(log_entry + "\n")
+        self.logger.log(level, message, extra=fields)
 
     
     def get_prices(self):
        
         """
         Этот метод обращается к API Московской Биржи (MOEX) для получения маркетдаты
-        Идем за маркетдатой в MOEX API 
-        Выполненный запрос сохраняем в json
+        Идем за маркетдатой в MOEX API по всем режимам торгов
+        Возвращает словарь снимков {board: PriceSnapshot}
         """
         
         # Запись сообщения о начале запроса в лог
-        self.log_message("Requesting prices for the TQBR class...")
+        boards = ', '.join(spec.board for spec in self.boards)
+        self.log_message(f"Requesting prices for boards: {boards}...")
+
+        # Параллельный запрос всех режимов торгов через общую HTTP-сессию
+        # Время получения фиксируется по каждому режиму в момент его успешного ответа
+        board_data, errors = self.http.fetch_all()
+
+        # Неудачные режимы запрашиваем повторно с экспоненциально растущей паузой
+        for attempt in range(self.fetch_retries):
+            if not errors:
+                break
+            delay = min(self.fetch_backoff * 2 ** attempt, 30)
+            for board, e in errors.items():
+                self.log_message(f"Error retrieving {board} data: {e}. Retrying in {delay:.1f} s...",
+                                 level=logging.WARNING)
+            sleep(delay)
+            retry_specs = [spec for spec in self.boards if spec.board in errors]
+            retried, errors = self.http.fetch_all(retry_specs)
+            board_data.update(retried)
+
+        for board, e in errors.items():
+            # Ошибка одного режима не мешает записать остальные
+            self.log_message(f"Error retrieving {board} data: {e}", level=logging.ERROR)
+            METRICS.inc('fetch_errors_total', board=board)
+
+        if not board_data:
+            # Не удалось получить ни одного режима - пропускаем цикл, приложение продолжает работу
+            self.log_message("No board data received.", level=logging.ERROR)
+            self.snapshots, self.snapshot = {}, None
+            return self.snapshots
+
+        METRICS.set('last_successful_fetch_timestamp_seconds',
+                    max(fetched_at for fetched_at, _ in board_data.values()).timestamp())
+        # Ответы API сразу превращаем в компактные снимки с временем получения
+        self.snapshots = {
+            board: PriceSnapshot.from_iss(data, board, fetched_at)
+            for board, (fetched_at, data) in board_data.items()
+        }
+        for board, snapshot in self.snapshots.items():
+            # Запись сообщения об успешном получении данных в лог
+            self.log_message(f"{board} data successfully received: {len(snapshot)} securities.")
 
-        try:
-            # Выполнение HTTP GET запроса к MOEX API для получения маркетдаты акций TQBR
-            response = requests.get(
-                'http://iss.moex.com/iss/engines/stock/markets/shares/boards/TQBR/securities.json', 
-                params={
-                    'iss.meta': 'off',        # Отключение метаданных в ответе
-                    'iss.only': 'marketdata', # Получение только данных рынка
-                    'marketdata.columns': 'SECID,LAST' # Указание запрашиваемых колонок: идентификатор ценной бумаги и последняя цена
-                }
-            )
-            
-            # Проверка на ошибки HTTP в ответе
-            response.raise_for_status()
+        # Снимок основного режима используется в show_prices и метриках
+        self.snapshot = self.snapshots.get(self.primary_board)
 
-            # Извлечение нужных данных из JSON-ответа
-            self.latest_data = response.json()['marketdata']['data']
+        if self.snapshot and self.json_export:
+            try:
+                # Необязательная выгрузка в JSON: временный файл + rename
+                write_json_atomic(self.snapshot, self.json_export)
+                self.log_message(f"{self.primary_board} data exported to {self.json_export}.")
+            except Exception as e:
+                self.log_message(f"Error exporting {self.primary_board} data to {self.json_export}: {e}", level=logging.ERROR)
 
-            # Запись сообщения об успешном получении данных в лог
-            self.log_message("TQBR data successfully received.")
-            
-            # Сохранение полученных данных в локальный JSON-файл
-            with open('latest_prices.json', 'w', encoding='utf-8') as json_file:
-                json.dump(self.latest_data, json_file)
-
-            # Запись сообщения о сохранении данных в файл в лог
-            self.log_message("TQBR data saved to latest_prices.json.")
-            
+        # Оповещения и аналитика не зависят от записи в БД и считаются сразу после опроса
+        self.check_alerts(self.snapshots)
+        self.analyze_snapshots(self.snapshots)
+
+        return self.snapshots
+
+
+    def analyze_snapshots(self, snapshots):
+
+        """
+        Метод векторного анализа снимков {board: PriceSnapshot} относительно
+        предыдущего опроса: доля Null, число выросших/упавших/неизменных тикеров
+        и тикеры с доходностью за пределами outlier_zscore стандартных отклонений.
+        Возвращает словарь {board: SnapshotStats}.
+        """
+
+        results = {}
+        for board, snapshot in snapshots.items():
+            try:
+                stats = results[board] = self.analytics.update(snapshot)
+                METRICS.set('null_price_percentage', stats.null_ratio * 100, board=board)
+            except Exception as e:
+                # Ошибка аналитики не должна мешать записи цен
+                self.log_message(f"Error analyzing {board} snapshot: {e}", level=logging.ERROR)
+                continue
+            outliers = ', '.join(f"{ticker} {change * 100:+.2f}% (z={score:.1f})" for ticker, change, score in stats.outliers)
+            self.log_message(
+                f"{board} analytics: null {stats.null_ratio * 100:.2f}%, advancers={stats.advancers}, "
+                f"decliners={stats.decliners}, unchanged={stats.unchanged}"
+                f"{', outliers: ' + outliers if outliers else ''}",
+                board=board, advancers=stats.advancers, decliners=stats.decliners,
+                unchanged=stats.unchanged, outliers=stats.outliers)
+        return results
+
+
+    def check_alerts(self, snapshots):
+
+        """
+        Метод проверки снимков {board: PriceSnapshot} правилами оповещений.
+        Возвращает список сработавших оповещений (пустой, если правила не заданы).
+        """
+
+        if not self.alerts:
+            return []
+        alerts = []
+        try:
+            for snapshot in snapshots.values():
+                alerts.extend(self.alerts.evaluate(snapshot))
+            if alerts:
+                METRICS.inc('alerts_fired_total', len(alerts))
         except Exception as e:
-            # Запись сообщения об ошибке при запросе данных в лог и завершение программы с ошибкой
-            self.log_message(f"Error retrieving TQBR data: {e}")
-            sys.exit(1)  # Завершение программы с кодом ошибки 1
+            # Ошибка в правилах не должна мешать записи цен
+            self.log_message(f"Error checking alerts: {e}", level=logging.ERROR)
+        return alerts
 
     
-    def update_db(self):
+    def update_db(self, snapshots=None):
         
         """
-        Метод для обновления базы ценовыми значениями TQBR тикеров, полученными через API
-        вызывается когда требуется записать в базу то, что есть в json,
-        который был получен при вызове метода get_prices()
+        Метод для обновления базы ценовыми значениями тикеров, полученными через API
+        snapshots - словарь {board: PriceSnapshot}, по умолчанию
+        результат последнего вызова get_prices()
+        Если БД недоступна, снимок откладывается в локальную очередь self.spool
+        и записывается позже в порядке времени получения.
         """
 
+        snapshots = self.snapshots if snapshots is None else snapshots
+
         # Запись в лог о начале процесса обновления БД
         self.log_message("Updating the database...")
 
         # Проверка, есть ли актуальные данные для записи в БД
-        if self.latest_data:
-            # Открытие блока try для перехвата исключений в процессе обновления БД
-            try:
-                # Установление соединения с БД
-                conn = psycopg2.connect(
-                    dbname=self.dbname,
-                    user=self.user,
-                    password=self.password,
-                    host=self.host,
-                    port=self.port
-                )
-                # Создание объекта cursor для выполнения операций в БД
-                cursor = conn.cursor()
-
-                # SQL запрос для вставки данных
-                insert_query = """
-                INSERT INTO TQBR_prices (quote_date, quote_time, ticker, price)
-                VALUES (%s, %s, %s, %s);
-                """
-                # Получение текущей даты и времени
-                now = datetime.now()
-                current_date = now.date()
-                current_time = now.time()
-
-                # Перебор последовательности данных и вставка каждой записи в БД
-                for security in self.latest_data:
-                    ticker, price = security[0], security[1]  # Извлечение данных о ценной бумаге
-                    cursor.execute(insert_query, (current_date, current_time, ticker, price))  # Выполнение SQL запроса
-
-                # Подтверждение транзакций в БД
-                conn.commit()
-
-                # Запись в лог о успешном добавлении данных в БД
-                self.log_message("Data for the TQBR class successfully added to the database.")
-            except Exception as e:
-                # В случае неудачи запись в лог информации об ошибке
-                self.log_message(f"Error updating the database: {e}")
-            finally:
-                # Закрытие курсора и соединения с БД в любом случае
-                cursor.close()
-                conn.close()
-        else:
+        if not snapshots:
             # Если данных для обновления нет, запись соответствующего сообщения в лог
             self.log_message("No data to update the database, the get_prices method was not run before the update.")
+            return
+
+        # Раз в сутки проверяем, что партиции на ближайшие месяцы созданы
+        if self.partitions_checked != datetime.now().date():
+            self.maintain_partitions()
+
+        # Сначала выгружаем отложенные снимки, полученные раньше текущего, чтобы данные попали в БД по порядку
+        if self.spool and not self.replay_spool(snapshot_time(snapshots)):
+            # БД все еще недоступна - текущий снимок тоже в очередь
+            self.spool.push(snapshots)
+            METRICS.inc('persist_errors_total')
+            METRICS.set('spool_depth', self.spool.depth())
+            self.log_message(f"Database unavailable, snapshot spooled. Spool depth: {self.spool.depth()}.",
+                             level=logging.WARNING)
+            return
+
+        # Открытие блока try для перехвата исключений в процессе обновления БД
+        try:
+            # Одна транзакция на цикл через постоянное соединение из пула
+            (_, rows, suppressed, full_snapshot, _, _), = self.persist_snapshots([snapshots])
+            METRICS.set('rows_per_cycle', len(rows))
+
+            # Запись в лог о успешном добавлении данных в БД
+            self.log_message(f"Data for {len(snapshots)} boards successfully added to the database: {len(rows)} rows.")
+            if self.delta:
+                stats = self.delta.stats
+                self.log_message(
+                    f"Delta mode: suppressed {suppressed} unchanged rows this cycle"
+                    f"{' (heartbeat full snapshot)' if full_snapshot else ''}, "
+                    f"total written={stats['written']}, suppressed={stats['suppressed']}")
+            stats = self.db.stats()
+            self.log_message(
+                f"DB pool: connects={stats['connects']}, reuses={stats['reuses']}, "
+                f"reconnects={stats['reconnects']}, connect_avg={stats['connect_ms_avg']:.1f} ms")
+        except DbPool.CONNECTION_ERRORS as e:
+            # БД недоступна: запись в лог информации об ошибке
+            self.log_message(f"Error updating the database: {e}", level=logging.ERROR)
+            METRICS.inc('persist_errors_total')
+            if self.spool:
+                # Снимок не теряется: он будет записан после восстановления БД
+                self.spool.push(snapshots)
+                METRICS.set('spool_depth', self.spool.depth())
+                self.log_message(f"Snapshot spooled. Spool depth: {self.spool.depth()}.", level=logging.WARNING)
+        except Exception as e:
+            # БД доступна, но отклонила данные: повтор даст ту же ошибку, поэтому в очередь не ставим
+            self.log_message(f"Error updating the database: {e}", level=logging.ERROR)
+            METRICS.inc('persist_errors_total')
+            if self.spool:
+                self.spool.push_dead(snapshots, str(e))
+                METRICS.inc('dead_letter_snapshots_total')
+                self.log_message("Snapshot moved to the spool dead-letter table.", level=logging.WARNING)
+
+
+    def persist_snapshots(self, batch):
+
+        """
+        Метод записи нескольких снимков в одной транзакции: цены, OHLC агрегаты
+        и процент нулевых цен основного режима по каждому снимку по порядку.
+        batch - список словарей {board: PriceSnapshot} в порядке получения.
+        В режиме delta каждый снимок сравнивается с ценами, записанными до него,
+        в том числе предыдущими снимками пачки (выгрузка отложенных снимков).
+        Возвращает план записи: по кортежу
+        (все строки, записанные строки, пропущено, полный снимок, основной снимок, процент Null)
+        на каждый снимок. Исключения пробрасываются вызывающему коду.
+        """
+
+        # Подготовка строк по всем режимам торгов, ts - время получения снимка;
+        # heartbeat режима delta отсчитывается по времени получения снимков, а не записи
+        batch_rows = [[row for snapshot in snapshots.values() for row in snapshot.to_rows()] for snapshots in batch]
+        times = [min(snapshot.fetched_at for snapshot in snapshots.values()) for snapshots in batch]
+
+        # В режиме delta оставляем только изменившиеся цены
+        # (или весь снимок, если подошло время heartbeat);
+        # агрегаты строятся по полному снимку
+        if self.delta:
+            filtered = self.delta.filter_batch(list(zip(batch_rows, times)))
+        else:
+            filtered = [(snapshot_rows, 0, True) for snapshot_rows in batch_rows]
+
+        plan = []
+        for snapshots, snapshot_rows, (rows, suppressed, full_snapshot) in zip(batch, batch_rows, filtered):
+            # Процент нулевых цен считаем заранее, чтобы записать его в той же транзакции
+            primary = snapshots.get(self.primary_board)
+            null_price_percentage = self.calculate_null_prices_percentage(primary, save=False) if primary else None
+            plan.append((snapshot_rows, rows, suppressed, full_snapshot, primary, null_price_percentage))
+
+        written = [row for _, rows, _, _, _, _ in plan for row in rows]
+
+        def work(cursor):
+            # Запись цен всех снимков одним вызовом выбранным способом (row / values / copy)
+            with METRICS.timer('db_insert'):
+                self.write_prices(cursor, written)
+            for snapshot_rows, _, _, _, primary, null_price_percentage in plan:
+                # Инкрементальное обновление OHLC свечей и последних цен
+                with METRICS.timer('rollups'):
+                    update_rollups(cursor, snapshot_rows)
+                # Запись метрики нулевых цен основного режима на время получения снимка
+                if null_price_percentage is not None:
+                    with METRICS.timer('metrics_write'):
+                        self.insert_null_prices_percentage(cursor, null_price_percentage, primary.fetched_at)
+
+        # Вся транзакция вместе с commit
+        with METRICS.timer('db_transaction'):
+            self.db.run(work)
+        METRICS.inc('rows_written_total', len(written))
+        METRICS.inc('delta_suppressed_rows_total', sum(suppressed for _, _, suppressed, _, _, _ in plan))
+        METRICS.set('last_successful_persist_timestamp_seconds', datetime.now().timestamp())
+
+        if self.delta:
+            # Запоминаем записанные цены только после успешного commit
+            for (_, rows, suppressed, full_snapshot, _, _), now in zip(plan, times):
+                self.delta.commit(rows, suppressed, full_snapshot, now)
+        return plan
+
+
+    def replay_spool(self, before=None):
+
+        """
+        Метод выгрузки отложенных снимков из self.spool в БД пачками по spool_batch,
+        в порядке времени получения. before (unix time) - выгружаются только снимки,
+        полученные раньше: update_db передает время записываемого снимка, чтобы
+        более новые отложенные снимки не попали в БД раньше него.
+        Возвращает True, если все такие снимки записаны,
+        и False, если БД снова недоступна. Если пачка не записалась по другой
+        причине, она повторяется по одному снимку, а снимок с ошибкой
+        переносится в spool_dead, чтобы выгрузка шла дальше.
+        """
+
+        batch = self.spool.peek(self.spool_batch, before)
+        if not batch:
+            return True
+
+        self.log_message(f"Replaying spooled snapshots, spool depth: {self.spool.depth()}...")
+        started = perf_counter()
+        replayed, replayed_rows = 0, 0
+        singles = 0  # сколько следующих снимков выгружать по одному после ошибки пачки
+        while batch:
+            try:
+                plan = self.persist_snapshots([snapshots for _, snapshots in batch])
+            except DbPool.CONNECTION_ERRORS as e:
+                self.log_message(f"Error replaying spooled snapshots: {e}", level=logging.ERROR)
+                return False
+            except Exception as e:
+                if len(batch) > 1:
+                    # Ищем испорченный снимок, повторяя пачку по одному
+                    singles = len(batch)
+                    batch = self.spool.peek(1, before)
+                    continue
+                self.spool.bury([spool_id for spool_id, _ in batch], str(e))
+                METRICS.inc('dead_letter_snapshots_total')
+                self.log_message(f"Spooled snapshot moved to the dead-letter table: {e}", level=logging.ERROR)
+                singles = max(singles - 1, 0)
+                batch = self.spool.peek(1 if singles else self.spool_batch, before)
+                continue
+            singles = max(singles - 1, 0)
+            # Удаляем из очереди только то, что уже закоммичено в postgres
+            self.spool.remove([spool_id for spool_id, _ in batch])
+            replayed += len(batch)
+            replayed_rows += sum(len(rows) for _, rows, _, _, _, _ in plan)
+            batch = self.spool.peek(1 if singles else self.spool_batch, before)
+
+        METRICS.set('spool_depth', self.spool.depth())
+        elapsed = perf_counter() - started
+        self.spool.stats['replay_rows_per_sec'] = replayed_rows / elapsed if elapsed else 0.0
+        METRICS.set('spool_replay_rows_per_sec', self.spool.stats['replay_rows_per_sec'])
+        self.log_message(
+            f"Spool replayed: {replayed} snapshots, {replayed_rows} rows, "
+            f"{self.spool.stats['replay_rows_per_sec']:.0f} rows/sec.")
+        return True
     
 
-    def show_prices(self):
-        
+    def maintain_partitions(self):
+
         """
-        метод для вывода информаци в консоль о тикерах 
-        TQBR из json файла, вызывается после запроса get_prices()
+        Метод обслуживания помесячных партиций tqbr_prices:
+        создает партиции на текущий и два следующих месяца,
+        удаляет партиции старше retention_months месяцев.
+        Вызывается при старте и раз в сутки из update_db.
         """
 
-        # Блок try-catch, чтобы обработать возможные исключения при выполнении кода
+        def work(cursor):
+            cursor.execute(
+                "SELECT tqbr_prices_maintain_partitions(%s, %s);",
+                (2, self.retention_months)
+            )
+            return cursor.fetchone()[0]
+
         try:
-            # Открытие файла 'latest_prices.json' в режиме чтения
-            with open('latest_prices.json', 'r', encoding='utf-8') as json_file:
-                # Загрузка данных из json-файла в переменную self.latest_data
-                self.latest_data = json.load(json_file)
-            
-            # Проверка наличия данных в self.latest_data
-            if self.latest_data:
-
-                # Получение времени последнего изменения файла 'latest_prices.json'
-                # и преобразование его в читаемый формат для вывода
-                last_updated = datetime.fromtimestamp(os.path.getmtime('latest_prices.json'))
-                self.log_message(
-                    f"SHOW LATEST: Current information as of {last_updated.strftime('%Y-%m-%d %H:%M:%S')}")
-                
-                # Перебор всех записей в последних данных и логирование тикера и цены
-                for security in self.latest_data:
-                    ticker, price = security[0], security[1]  # Извлечение тикера и цены
-                    self.log_message(f"Ticker: {ticker}, Price: {price}")  # Вывод тикера и цены в лог
-            else:
-                # Если данных нет, выводится сообщение о том, что get_prices не был выполнен
-                self.log_message("No data to display. The get_prices method was not run.")
+            dropped = self.db.run(work)
+            self.partitions_checked = datetime.now().date()
+            if dropped:
+                self.log_message(f"Dropped {dropped} expired tqbr_prices partitions.")
+        except Exception as e:
+            self.log_message(f"Error maintaining tqbr_prices partitions: {e}", level=logging.ERROR)
+
+
+    def seed_last_prices(self):
+
+        """
+        Метод заполнения фильтра delta последними ценами из БД,
+        вызывается один раз при старте, чтобы после перезапуска
+        не записывать повторно весь снимок.
+        """
+
+        if not self.delta:
+            return
+
+        # Последняя ненулевая цена и ее время по каждому тикеру каждого режима
+        query = """
+        SELECT DISTINCT ON (board, ticker) board, ticker, price, ts
+        FROM tqbr_prices
+        WHERE price IS NOT NULL AND ts > now() - INTERVAL '7 days'
+        ORDER BY board, ticker, ts DESC;
+        """
+
+        def work(cursor):
+            cursor.execute(query)
+            return cursor.fetchall()
+
+        try:
+            rows = self.db.run(work)
+            self.delta.seed(rows)
+            self.log_message(f"Delta mode: seeded last prices for {len(rows)} tickers from the database.")
         except Exception as e:
-            # Логирование исключения в случае ошибки при чтении файла
-            self.log_message(f"Error reading data from the JSON file: {e}")
+            # Без начальных цен первый цикл просто запишет полный снимок
+            self.log_message(f"Error seeding last prices from the database: {e}", level=logging.ERROR)
+
+
+    def write_prices(self, cursor, rows, mode=None):
+
+        """
+        Метод записи строк цен в таблицу tqbr_prices через переданный курсор.
+        rows - последовательность кортежей (ts, ticker, price, board).
+        mode - способ записи, по умолчанию берется self.write_mode.
+        commit не выполняется, транзакцией управляет вызывающий код.
+        """
+
+        mode = mode or self.write_mode
+
+        # Нечего записывать (например, в режиме delta цены не менялись)
+        if not rows:
+            return
+
+        if mode == 'copy':
+            # Формируем снимок в памяти в текстовом формате COPY:
+            # колонки разделены табуляцией, NULL кодируется как \N
+            buffer = io.StringIO()
+            for ts, ticker, price, board in rows:
+                value = '\\N' if price is None else price
+                buffer.write(f"{ts.isoformat()}\t{ticker}\t{value}\t{board}\n")
+            buffer.seek(0)
+            # Один поток COPY вместо сотен отдельных INSERT
+            cursor.copy_expert(
+                "COPY tqbr_prices (ts, ticker, price, board) FROM STDIN",
+                buffer
+            )
+        elif mode == 'values':
+            # Пакетная вставка: execute_values собирает несколько строк в один INSERT
+            execute_values(
+                cursor,
+                "INSERT INTO tqbr_prices (ts, ticker, price, board) VALUES %s",
+                rows,
+                page_size=1000
+            )
+        else:
+            # Исходный способ: один INSERT на каждую строку
+            insert_query = """
+            INSERT INTO tqbr_prices (ts, ticker, price, board)
+            VALUES (%s, %s, %s, %s);
+            """
+            for row in rows:
+                cursor.execute(insert_query, row)
+
+
+    def show_prices(self, snapshot=None):
+        
+        """
+        метод для вывода информаци в консоль о тикерах 
+        основного режима торгов, вызывается после запроса get_prices()
+        snapshot - PriceSnapshot, по умолчанию снимок последнего get_prices()
+        """
+
+        snapshot = self.snapshot if snapshot is None else snapshot
+
+        # Проверка наличия данных в снимке
+        if snapshot:
+            # Все тикеры и цены уходят одной записью в поле tickers;
+            # тикеры с уровнем детализации выше INFO отфильтрует логгер
+            self.log_message(
+                f"SHOW LATEST: Current information as of {snapshot.fetched_at.strftime('%Y-%m-%d %H:%M:%S')}",
+                tickers=dict(snapshot.items()))
+        else:
+            # Если данных нет, выводится сообщение о том, что get_prices не был выполнен
+            self.log_message("No data to display. The get_prices method was not run.")
     
     
+    def insert_null_prices_percentage(self, cursor, null_price_percentage, now=None):
+
+        """
+        Метод вставки процента нулевых цен через переданный курсор, без commit.
+        Используется update_db, чтобы метрика попала в одну транзакцию с ценами.
+        """
+
+        # SQL запрос на вставку данных о проценте записей с нулевой ценой
+        insert_query = """
+        INSERT INTO null_price_percent_metrics (calculation_date, calculation_time, percent_null_prices) 
+        VALUES (%s, %s, %s);
+        """
+        # Получение текущей даты и времени, если не передано явно
+        now = now or datetime.now()
+        current_date = now.strftime("%Y-%m-%d")  # Форматирование даты
+        current_time = now.strftime("%H:%M:%S")  # Форматирование времени
+
+        # Выполнение SQL команды с параметрами
+        cursor.execute(insert_query, (current_date, current_time, null_price_percentage))
+
+
     def save_null_prices_percentage_to_db(self, null_price_percentage):
         
         """
@@ -212,74 +614,50 @@ class MoexPriceTQBR:
         сохраняет информацию, полученную при выполнении calculate_null_prices_percentage()
         """
 
-        # Инициализация переменной соединения с базой данных
-        conn = None
         try:
-            # Установление соединения с базой данных
-            conn = psycopg2.connect(
-                dbname=self.dbname,  # Имя базы данных
-                user=self.user,      # Имя пользователя
-                password=self.password,  # Пароль
-                host=self.host,      # Хост
-                port=self.port       # Порт
-            )
-            # Создание курсора для выполнения операций с базой данных
-            cursor = conn.cursor()
-
-            # SQL запрос на вставку данных о проценте записей с нулевой ценой
-            insert_query = """
-            INSERT INTO null_price_percent_metrics (calculation_date, calculation_time, percent_null_prices) 
-            VALUES (%s, %s, %s);
-            """
-            # Получение текущей даты и времени
-            now = datetime.now()
-            current_date = now.strftime("%Y-%m-%d")  # Форматирование даты
-            current_time = now.strftime("%H:%M:%S")  # Форматирование времени
-
-            # Выполнение SQL команды с параметрами
-            cursor.execute(insert_query, (current_date, current_time, null_price_percentage))
-
-            # Подтверждение изменений в базе данных
-            conn.commit()
+            # Отдельная транзакция через соединение из пула
+            self.db.run(lambda cursor: self.insert_null_prices_percentage(cursor, null_price_percentage))
             # Запись сообщения о успешном сохранении данных в лог
-            self.log_message(f"Null price percentage data successfully added to the database - info")
+            self.log_message("Null price percentage data successfully added to the database")
 
         except Exception as e:
             # В случае возникновения ошибки записываем сообщение в лог
-            self.log_message(f"Error saving null price percentage to database: {e} - error")
-
-        finally:
-            # В блоке finally гарантируем закрытие курсора и соединения с базой данных
-            if conn:  # Проверяем, что соединение было установлено
-                cursor.close()
-                conn.close()
+            self.log_message(f"Error saving null price percentage to database: {e}", level=logging.ERROR)
     
-    def calculate_null_prices_percentage(self):
+    def calculate_null_prices_percentage(self, snapshot=None, save=True):
         
         """
         Метод для вычисления процента записей с нулевой ценой
-        рассчитывает Null от всех значений price в TQBR
-        и вызывает save_null_prices_percentage_to_db() для сохранения
+        рассчитывает Null от всех значений price основного режима торгов
+        и при save=True вызывает save_null_prices_percentage_to_db() для сохранения.
+        snapshot - PriceSnapshot, по умолчанию снимок последнего get_prices()
+        Возвращает рассчитанный процент или None, если данных нет.
         """
+
+        snapshot = self.snapshot if snapshot is None else snapshot
         
         # Проверка наличия данных для анализа
-        if not self.latest_data:
+        if not snapshot:
             # Если данных нет, выводится сообщение об ошибке и метод завершается
-            self.log_message("No data to analyze. The get_prices method was not run. - error")
+            self.log_message("No data to analyze. The get_prices method was not run.", level=logging.ERROR)
             return  # Ранний выход из метода
 
         # Подсчет общего количества записей
-        total_count = len(self.latest_data)
+        total_count = len(snapshot)
 
         # Подсчет количества записей со значением Null в цене
-        null_price_count = sum(1 for item in self.latest_data if item[1] is None)
+        null_price_count = snapshot.null_count()
 
         # Расчет процента записей с Null ценой от общего количества
         # Если total_count не равен нулю, иначе процент равен 0
         null_price_percentage = (null_price_count / total_count) * 100 if total_count else 0
 
         # Запись рассчитанного процента в лог
-        self.log_message(f"Percent of tickers with null price: {null_price_percentage:.2f}% - info")
+        self.log_message(f"Percent of tickers with null price: {null_price_percentage:.2f}%",
+                         null_price_percentage=null_price_percentage)
 
         # Вызов метода для сохранения рассчитанного процента в базу данных
-        self.save_null_prices_percentage_to_db(null_price_percentage)
\ No newline at end of file
+        if save:
+            self.save_null_prices_percentage_to_db(null_price_percentage)
+
+        return null_price_percentage
@@ -0,0 +1,87 @@
+from datetime import timedelta
+
+
+class PriceDeltaFilter:
+    """
+    Фильтр изменений цен для режима записи "только изменения".
+
+    Хранит в памяти последнюю записанную цену по каждой паре (board, ticker)
+    и пропускает в БД только строки, где цена изменилась или впервые
+    стала не Null. Раз в heartbeat_minutes минут пропускается полный снимок,
+    чтобы в таблице оставались опорные точки даже вне торговой сессии.
+
+    seed:
+    заполняет память последними ценами из БД при старте; время последней
+    из них считается временем последнего полного снимка, иначе heartbeat
+    сразу после перезапуска переписал бы весь снимок.
+
+    filter:
+    отбирает строки для записи, возвращает (строки, сколько пропущено, полный ли снимок).
+
+    filter_batch:
+    то же для нескольких снимков по порядку: каждый снимок сравнивается
+    с ценами предыдущих снимков пачки, память фильтра не меняется до commit.
+
+    commit:
+    запоминает записанные строки после успешной транзакции.
+    """
+
+    def __init__(self, heartbeat_minutes=0):
+        self.heartbeat = timedelta(minutes=heartbeat_minutes) if heartbeat_minutes else None
+        self.last_prices = {}         # {(board, ticker): последняя записанная цена}
+        self.last_full_snapshot = None
+        self.stats = {
+            'written': 0,     # строк записано за все время
+            'suppressed': 0,  # строк пропущено как неизменившиеся
+            'heartbeats': 0,  # полных снимков по heartbeat
+        }
+
+    def seed(self, rows):
+        # rows - последовательность (board, ticker, price, ts) из БД
+        for board, ticker, price, ts in rows:
+            self.last_prices[(board, ticker)] = None if price is None else float(price)
+            if self.last_full_snapshot is None or ts > self.last_full_snapshot:
+                self.last_full_snapshot = ts
+
+    def filter(self, rows, now):
+        # rows - кортежи (ts, ticker, price, board), как в write_prices
+        return self.filter_batch([(rows, now)])[0]
+
+    def filter_batch(self, batch):
+        # batch - список (rows, now) в порядке получения снимков
+        pending = {}                  # цены, которые запишут предыдущие снимки пачки
+        last_full_snapshot = self.last_full_snapshot
+        results = []
+        for rows, now in batch:
+            if self.heartbeat and (last_full_snapshot is None or now - last_full_snapshot >= self.heartbeat):
+                # Пора записать полный снимок
+                last_full_snapshot = now
+                kept, suppressed, full_snapshot = list(rows), 0, True
+            else:
+                kept = []
+                for row in rows:
+                    ticker, price, board = row[1], row[2], row[3]
+                    if price is None:
+                        # Null не пишем: это не новая цена, а ее отсутствие
+                        continue
+                    key = (board, ticker)
+                    if pending.get(key, self.last_prices.get(key)) != price:
+                        kept.append(row)
+                suppressed, full_snapshot = len(rows) - len(kept), False
+            for row in kept:
+                if row[2] is not None:
+                    pending[(row[3], row[1])] = row[2]
+            results.append((kept, suppressed, full_snapshot))
+        return results
+
+    def commit(self, rows, suppressed, full_snapshot, now):
+        # Вызывается только после успешного commit в БД, иначе память разойдется с таблицей
+        for row in rows:
+            ticker, price, board = row[1], row[2], row[3]
+            if price is not None:
+                self.last_prices[(board, ticker)] = price
+        if full_snapshot:
+            self.last_full_snapshot = now
+            self.stats['heartbeats'] += 1
+        self.stats['written'] += len(rows)
+        self.stats['suppressed'] += suppressed
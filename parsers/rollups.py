@@ -0,0 +1,117 @@
+from datetime import timedelta
+
+from psycopg2.extras import execute_values
+
+# Таблицы OHLC агрегатов и шаг свечи для date_trunc (см. migrations/003_tqbr_prices_rollups.sql)
+ROLLUP_TABLES = (
+    ('tqbr_prices_ohlc_1m', 'minute'),
+    ('tqbr_prices_ohlc_1h', 'hour'),
+    ('tqbr_prices_ohlc_1d', 'day'),
+)
+
+# Upsert свечи: open остается от первой цены интервала, high/low расширяются,
+# close и счетчик обновляются последней ценой
+OHLC_UPSERT = """
+INSERT INTO {table} AS t (bucket, board, ticker, open, high, low, close, samples)
+VALUES %s
+ON CONFLICT (ticker, board, bucket) DO UPDATE SET
+    high = GREATEST(t.high, EXCLUDED.high),
+    low = LEAST(t.low, EXCLUDED.low),
+    close = EXCLUDED.close,
+    samples = t.samples + EXCLUDED.samples;
+"""
+
+LAST_PRICE_UPSERT = """
+INSERT INTO tqbr_last_prices AS t (board, ticker, ts, price)
+VALUES %s
+ON CONFLICT (ticker, board) DO UPDATE SET
+    ts = EXCLUDED.ts,
+    price = EXCLUDED.price
+WHERE EXCLUDED.ts >= t.ts;
+"""
+
+
+def update_rollups(cursor, rows):
+    """
+    Инкрементально обновляет OHLC свечи 1m/1h/1d и таблицу последних цен
+    по строкам снимка rows - кортежам (ts, ticker, price, board), как в write_prices.
+    Строки с Null ценой пропускаются. commit не выполняется.
+    """
+
+    # Одна строка на (board, ticker): ON CONFLICT не может обновить строку дважды за запрос
+    latest = {}
+    for ts, ticker, price, board in rows:
+        if price is not None:
+            latest[(board, ticker)] = (ts, ticker, price, board)
+    if not latest:
+        return
+
+    values = list(latest.values())
+    for table, unit in ROLLUP_TABLES:
+        execute_values(
+            cursor,
+            OHLC_UPSERT.format(table=table),
+            [(ts, board, ticker, price, price, price, price) for ts, ticker, price, board in values],
+            template=f"(date_trunc('{unit}', %s::timestamptz, 'Europe/Moscow'), %s, %s, %s, %s, %s, %s, 1)",
+            page_size=1000
+        )
+    execute_values(
+        cursor,
+        LAST_PRICE_UPSERT,
+        [(board, ticker, ts, price) for ts, ticker, price, board in values],
+        page_size=1000
+    )
+
+
+# Пересчет свечи из исходных цен целиком: в отличие от OHLC_UPSERT значения заменяются,
+# поэтому пересчет можно повторять и выполнять для данных, загруженных не по порядку
+OHLC_REBUILD = """
+INSERT INTO {table} AS t (bucket, board, ticker, open, high, low, close, samples)
+SELECT date_trunc('{unit}', ts, 'Europe/Moscow'), board, ticker,
+       (array_agg(price ORDER BY ts))[1], max(price), min(price),
+       (array_agg(price ORDER BY ts DESC))[1], count(*)
+FROM public.tqbr_prices
+WHERE board = %(board)s AND ticker = ANY(%(tickers)s) AND price IS NOT NULL
+  AND ts >= %(start)s AND ts < %(end)s
+GROUP BY 1, 2, 3
+ON CONFLICT (ticker, board, bucket) DO UPDATE SET
+    open = EXCLUDED.open,
+    high = EXCLUDED.high,
+    low = EXCLUDED.low,
+    close = EXCLUDED.close,
+    samples = EXCLUDED.samples;
+"""
+
+LAST_PRICE_REBUILD = """
+INSERT INTO tqbr_last_prices AS t (board, ticker, ts, price)
+SELECT DISTINCT ON (board, ticker) board, ticker, ts, price
+FROM public.tqbr_prices
+WHERE board = %(board)s AND ticker = ANY(%(tickers)s) AND price IS NOT NULL
+  AND ts >= %(start)s AND ts < %(end)s
+ORDER BY board, ticker, ts DESC
+ON CONFLICT (ticker, board) DO UPDATE SET
+    ts = EXCLUDED.ts,
+    price = EXCLUDED.price
+WHERE EXCLUDED.ts >= t.ts;
+"""
+
+
+def rebuild_rollups(cursor, board, tickers, start, end):
+    """
+    Пересчитывает OHLC свечи и последние цены тикеров tickers режима board
+    по данным tqbr_prices за период [start, end). Нужен для исторической
+    загрузки (backfill.py), когда строки приходят не в хронологическом порядке.
+    Период расширяется до границ московских суток, чтобы дневные свечи
+    пересчитывались целиком. commit не выполняется.
+    """
+
+    params = {'board': board, 'tickers': list(tickers)}
+    cursor.execute(
+        "SELECT date_trunc('day', %s::timestamptz, 'Europe/Moscow'), "
+        "date_trunc('day', %s::timestamptz, 'Europe/Moscow') + interval '1 day'",
+        (start, end - timedelta(microseconds=1))
+    )
+    params['start'], params['end'] = cursor.fetchone()
+    for table, unit in ROLLUP_TABLES:
+        cursor.execute(OHLC_REBUILD.format(table=table, unit=unit), params)
+    cursor.execute(LAST_PRICE_REBUILD, params)
@@ -0,0 +1,231 @@
+import logging
+import queue
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from parsers.metrics import METRICS, PROFILER
+
+# Москва живет в UTC+3 без перехода на летнее время
+MSK = timezone(timedelta(hours=3), 'MSK')
+
+# Торговые сессии фондового рынка MOEX по умолчанию (московское время):
+# утренняя + основная с аукционом закрытия, вечерняя
+DEFAULT_SESSIONS = '06:50-18:50,19:00-23:50'
+
+# Поведение при переполнении очереди между опросом и записью в БД:
+#   drop_oldest - выбросить самый старый ожидающий снимок (по умолчанию)
+#   drop_newest - выбросить только что полученный снимок
+#   block       - ждать, пока запись освободит место (опрос будет отставать)
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+def parse_sessions(value):
+    # Разбор строки "06:50-18:50,19:00-23:50" в список пар (начало, конец) типа time
+    sessions = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        start, _, end = item.partition('-')
+        sessions.append((
+            datetime.strptime(start.strip(), '%H:%M').time(),
+            datetime.strptime(end.strip(), '%H:%M').time(),
+        ))
+    return sessions
+
+
+def parse_weekdays(value):
+    # Разбор строки "0,1,2,3,4" (0 - понедельник) в множество дней недели
+    return {int(day) for day in value.split(',') if day.strip()}
+
+
+class TradingCalendar:
+    """
+    Расписание торговых сессий MOEX по московскому времени.
+    Праздничные дни не учитываются: в такие дни опрос идет как в торговые.
+
+    is_open:
+    идет ли сейчас торговая сессия.
+
+    next_open:
+    ближайшее начало сессии после указанного момента.
+    """
+
+    def __init__(self, sessions=DEFAULT_SESSIONS, weekdays=(0, 1, 2, 3, 4)):
+        self.sessions = parse_sessions(sessions) if isinstance(sessions, str) else list(sessions)
+        self.weekdays = set(weekdays)
+
+    def is_open(self, now):
+        now = now.astimezone(MSK)
+        if now.weekday() not in self.weekdays:
+            return False
+        return any(start <= now.time() < end for start, end in self.sessions)
+
+    def next_open(self, now):
+        now = now.astimezone(MSK)
+        for days in range(8):
+            day = (now + timedelta(days=days)).date()
+            if day.weekday() not in self.weekdays:
+                continue
+            for start, _ in sorted(self.sessions):
+                opening = datetime.combine(day, start, tzinfo=MSK)
+                if opening > now:
+                    return opening
+        return None
+
+
+def align(now, interval):
+    # Ближайшая метка времени после now, кратная interval секундам (от начала эпохи).
+    # Для интервалов, делящих час, это ровно :00, :05, :10... по часам
+    timestamp = now.timestamp()
+    return datetime.fromtimestamp((timestamp // interval + 1) * interval, tz=now.tzinfo)
+
+
+class PollScheduler:
+    """
+    Планировщик циклов опроса без накопления сдвига.
+
+    Опрос запускается по меткам, выровненным по часам (например, каждые 5 минут
+    ровно в :00, :05, ...), а не через sleep после работы, поэтому период не
+    "уплывает" на время обработки. Во время торговой сессии используется
+    interval, вне ее - closed_interval (0 - не опрашивать до открытия сессии).
+
+    Опрос и запись разнесены по потокам: основной поток получает снимки
+    и кладет их в ограниченную очередь, фоновый поток пишет их в БД.
+    Медленная запись не задерживает следующий опрос; при переполнении
+    очереди действует политика overflow; при drop_oldest и настроенной у fetcher
+    очереди SPOOL_PATH вытесненный снимок откладывается в нее, а не выбрасывается.
+    """
+
+    def __init__(self, fetcher, interval, closed_interval=0, calendar=None,
+                 queue_size=2, overflow='drop_oldest'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy '{overflow}', expected one of {OVERFLOW_POLICIES}")
+        self.fetcher = fetcher
+        self.interval = interval
+        self.closed_interval = closed_interval
+        self.calendar = calendar or TradingCalendar()
+        self.overflow = overflow
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.worker = None
+        self.stats = {
+            'cycles': 0,          # выполнено опросов
+            'persisted': 0,       # записано снимков
+            'dropped': 0,         # снимков выброшено из-за переполнения очереди
+            'spooled': 0,         # старых снимков вытеснено из очереди в SPOOL_PATH
+            'lag_seconds': 0.0,   # опоздание последнего запуска относительно метки
+        }
+
+    def next_run(self, now):
+        # Время следующего опроса с учетом торговой сессии
+        if self.calendar.is_open(now):
+            return align(now, self.interval)
+        opening = self.calendar.next_open(now)
+        if not self.closed_interval:
+            return opening
+        tick = align(now, self.closed_interval)
+        # Вне сессии опрашиваем редко, но к открытию сессии возвращаемся вовремя
+        return min(tick, opening) if opening else tick
+
+    def submit(self, snapshots):
+        # Передача снимков на запись с учетом политики переполнения
+        if self.overflow == 'block':
+            self.queue.put(snapshots)
+            return
+        while True:
+            try:
+                self.queue.put_nowait(snapshots)
+                return
+            except queue.Full:
+                if self.overflow == 'drop_newest':
+                    # Новый снимок не откладываем в spool: он оказался бы в БД раньше ждущих в очереди
+                    self.stats['dropped'] += 1
+                    METRICS.inc('dropped_snapshots_total')
+                    self.fetcher.log_message("Persist queue is full, dropping the new snapshot.", level=logging.WARNING)
+                    return
+                try:
+                    oldest = self.queue.get_nowait()
+                    self.queue.task_done()
+                    self._evict_oldest(oldest)
+                except queue.Empty:
+                    pass
+
+    def _evict_oldest(self, snapshots):
+        # Вытесненный самый старый снимок: при настроенной очереди SPOOL_PATH откладываем его туда.
+        # update_db выгружает из spool только снимки, полученные раньше записываемого,
+        # поэтому он попадет в БД перед следующим снимком очереди; без spool снимок теряется
+        spool = getattr(self.fetcher, 'spool', None)
+        if spool:
+            spool.push(snapshots)
+            self.stats['spooled'] += 1
+            METRICS.set('spool_depth', spool.depth())
+            self.fetcher.log_message("Persist queue is full, the oldest snapshot moved to the spool.",
+                                     level=logging.WARNING)
+            return
+        self.stats['dropped'] += 1
+        METRICS.inc('dropped_snapshots_total')
+        self.fetcher.log_message("Persist queue is full, dropping the oldest snapshot.", level=logging.WARNING)
+
+    def _persist_loop(self):
+        # Фоновый поток записи: берет снимки из очереди по порядку
+        while True:
+            snapshots = self.queue.get()
+            try:
+                if snapshots is None:
+                    return
+                # Профилирование по запросу через /debug/profile охватывает и запись в БД
+                with PROFILER.profile(), METRICS.timer('update_db'):
+                    self.fetcher.update_db(snapshots)
+                    self.fetcher.show_prices(snapshots.get(self.fetcher.primary_board))
+                self.stats['persisted'] += 1
+            except Exception as e:
+                # Ошибка одного снимка не должна останавливать поток записи
+                self.fetcher.log_message(f"Error persisting snapshot: {e}", level=logging.ERROR)
+            finally:
+                self.queue.task_done()
+                if snapshots is not None:
+                    METRICS.set('persist_queue_size', self.queue.qsize())
+                    PROFILER.cycle_done()
+
+    def start(self):
+        self.worker = threading.Thread(target=self._persist_loop, name='persist', daemon=True)
+        self.worker.start()
+
+    def stop(self):
+        # Дожидаемся записи всех снимков из очереди и останавливаем поток
+        if self.worker:
+            self.queue.put(None)
+            self.worker.join()
+            self.worker = None
+
+    def run(self, iterations=None):
+        # Основной цикл опроса; iterations ограничивает число опросов (None - бесконечно)
+        self.start()
+        try:
+            while iterations is None or self.stats['cycles'] < iterations:
+                now = datetime.now(timezone.utc)
+                tick = self.next_run(now)
+                if tick is None:
+                    self.fetcher.log_message("No trading sessions configured, polling stopped.", level=logging.ERROR)
+                    return
+                self.fetcher.log_message(f"Next poll at {tick.astimezone(MSK).strftime('%Y-%m-%d %H:%M:%S')} MSK.")
+                # Спим до метки; time.sleep может проснуться раньше, поэтому в цикле
+                while True:
+                    remaining = (tick - datetime.now(timezone.utc)).total_seconds()
+                    if remaining <= 0:
+                        break
+                    time.sleep(remaining)
+
+                self.stats['lag_seconds'] = (datetime.now(timezone.utc) - tick).total_seconds()
+                METRICS.set('scheduler_lag_seconds', self.stats['lag_seconds'])
+                with PROFILER.profile(), METRICS.timer('get_prices'):
+                    snapshots = self.fetcher.get_prices()
+                self.stats['cycles'] += 1
+                METRICS.inc('cycles_total')
+                # Если API не ответил ни по одному режиму, цикл пропускается
+                if snapshots:
+                    self.submit(snapshots)
+                    METRICS.set('persist_queue_size', self.queue.qsize())
+        finally:
+            self.stop()
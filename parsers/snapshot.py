@@ -0,0 +1,74 @@
+import json
+import math
+import os
+import tempfile
+from array import array
+
+import numpy as np
+
+
+class PriceSnapshot:
+    """
+    Снимок цен одного режима торгов, полученный за один запрос к MOEX API.
+
+    Хранится компактно: кортеж тикеров и массив array('d') цен той же длины,
+    отсутствующая цена (Null в ответе API) хранится как NaN.
+    Передается между get_prices, update_db, show_prices и
+    calculate_null_prices_percentage без промежуточного JSON-файла.
+
+    from_iss:
+    строит снимок из marketdata.data ответа ISS ([[SECID, LAST], ...]).
+
+    items:
+    пары (тикер, цена) с None вместо NaN, как в исходных данных API.
+
+    to_rows:
+    строки (ts, ticker, price, board) для записи в tqbr_prices.
+    """
+
+    __slots__ = ('board', 'fetched_at', 'tickers', 'prices')
+
+    def __init__(self, board, fetched_at, tickers, prices):
+        self.board = board
+        self.fetched_at = fetched_at  # время получения данных (datetime с часовым поясом)
+        self.tickers = tuple(tickers)
+        self.prices = prices if isinstance(prices, array) else array('d', prices)
+
+    @classmethod
+    def from_iss(cls, data, board, fetched_at):
+        tickers = [security[0] for security in data]
+        prices = array('d', (math.nan if security[1] is None else security[1] for security in data))
+        return cls(board, fetched_at, tickers, prices)
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def items(self):
+        # Пары (тикер, цена), NaN возвращается как None
+        for ticker, price in zip(self.tickers, self.prices):
+            yield ticker, (None if math.isnan(price) else price)
+
+    def null_count(self):
+        # Количество тикеров без цены: NumPy смотрит в буфер array('d') без копирования
+        return len(self.prices) - int(np.count_nonzero(~np.isnan(np.frombuffer(self.prices, dtype=np.float64))))
+
+    def to_rows(self):
+        # Строки для write_prices / update_rollups / PriceDeltaFilter
+        return [(self.fetched_at, ticker, price, self.board) for ticker, price in self.items()]
+
+
+def write_json_atomic(snapshot, path):
+    """
+    Сохраняет снимок в JSON в прежнем формате [[SECID, LAST], ...].
+    Запись идет во временный файл рядом с path и затем os.replace,
+    поэтому читатель файла никогда не увидит его наполовину записанным.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as json_file:
+            json.dump([[ticker, price] for ticker, price in snapshot.items()], json_file)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
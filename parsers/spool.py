@@ -0,0 +1,164 @@
+import json
+import math
+import sqlite3
+import threading
+from datetime import datetime
+
+from parsers.snapshot import PriceSnapshot
+
+
+def dump_snapshots(snapshots):
+    # Снимки {board: PriceSnapshot} в JSON-строку для хранения в очереди
+    return json.dumps({
+        board: {
+            'fetched_at': snapshot.fetched_at.isoformat(),
+            'tickers': list(snapshot.tickers),
+            'prices': [None if math.isnan(price) else price for price in snapshot.prices],
+        }
+        for board, snapshot in snapshots.items()
+    })
+
+
+def snapshot_time(snapshots):
+    # Время снимков одного опроса для упорядочивания очереди: самый ранний из режимов, unix time
+    return min(snapshot.fetched_at for snapshot in snapshots.values()).timestamp()
+
+
+def load_snapshots(payload):
+    # Обратное преобразование JSON-строки в {board: PriceSnapshot}
+    return {
+        board: PriceSnapshot(
+            board,
+            datetime.fromisoformat(item['fetched_at']),
+            item['tickers'],
+            [math.nan if price is None else price for price in item['prices']],
+        )
+        for board, item in json.loads(payload).items()
+    }
+
+
+class SnapshotSpool:
+    """
+    Локальная очередь снимков на SQLite для периода недоступности БД.
+
+    Если запись в postgres не удалась, снимок сохраняется в файл очереди
+    и не теряется при падении или перезапуске приложения. После восстановления
+    БД снимки выгружаются пачками в порядке времени получения (а не добавления
+    в очередь) и удаляются из очереди только после успешного commit в postgres. Снимки, которые postgres
+    отклоняет не из-за недоступности, а из-за самих данных, переносятся
+    в таблицу spool_dead, чтобы не блокировать очередь.
+
+    push:
+    добавляет снимки в конец очереди.
+
+    peek:
+    возвращает до limit самых старых по времени получения записей (id, снимки)
+    без удаления; before ограничивает выборку снимками, полученными раньше.
+
+    remove:
+    удаляет записанные в БД записи по id.
+
+    bury / push_dead:
+    переносит записи очереди по id или добавляет новые снимки в spool_dead
+    вместе с текстом ошибки, для ручного разбора.
+    """
+
+    def __init__(self, path='spool.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        # Очередь пишется из потока записи, а читается для метрик из других потоков
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                snapshot_ts REAL
+            )
+            """
+        )
+        # Файл очереди, созданный до появления snapshot_ts: колонку добавляем,
+        # старые записи без времени выгружаются первыми
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(spool)")]
+        if 'snapshot_ts' not in columns:
+            self._conn.execute("ALTER TABLE spool ADD COLUMN snapshot_ts REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS spool_snapshot_ts ON spool (snapshot_ts, id)")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS spool_dead (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at TEXT NOT NULL,
+                failed_at TEXT NOT NULL,
+                error TEXT NOT NULL,
+                payload TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self.stats = {
+            'spooled': 0,              # снимков отложено в очередь
+            'replayed': 0,             # снимков выгружено из очереди в БД
+            'replay_rows_per_sec': 0.0,  # скорость последней выгрузки, строк в секунду
+            'dead': 0,                 # снимков перенесено в spool_dead
+        }
+
+    def push(self, snapshots):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO spool (created_at, payload, snapshot_ts) VALUES (?, ?, ?)",
+                (datetime.now().astimezone().isoformat(), dump_snapshots(snapshots), snapshot_time(snapshots))
+            )
+            self._conn.commit()
+            self.stats['spooled'] += 1
+
+    def peek(self, limit, before=None):
+        # Снимки попадают в очередь не по порядку (вытеснение из очереди записи, ошибка записи
+        # уже взятого снимка), поэтому порядок задает время получения; NULL - записи старого формата
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM spool WHERE ? IS NULL OR snapshot_ts IS NULL OR snapshot_ts < ? "
+                "ORDER BY snapshot_ts, id LIMIT ?", (before, before, limit)
+            ).fetchall()
+        return [(spool_id, load_snapshots(payload)) for spool_id, payload in rows]
+
+    def remove(self, ids):
+        with self._lock:
+            self._conn.executemany("DELETE FROM spool WHERE id = ?", [(spool_id,) for spool_id in ids])
+            self._conn.commit()
+            self.stats['replayed'] += len(ids)
+
+    def bury(self, ids, error):
+        # Перенос записей очереди в spool_dead одной транзакцией
+        failed_at = datetime.now().astimezone().isoformat()
+        with self._lock:
+            for spool_id in ids:
+                self._conn.execute(
+                    "INSERT INTO spool_dead (created_at, failed_at, error, payload) "
+                    "SELECT created_at, ?, ?, payload FROM spool WHERE id = ?",
+                    (failed_at, error, spool_id)
+                )
+                self._conn.execute("DELETE FROM spool WHERE id = ?", (spool_id,))
+            self._conn.commit()
+            self.stats['dead'] += len(ids)
+
+    def push_dead(self, snapshots, error):
+        # Снимок, который не записался не из-за недоступности БД, сразу в spool_dead
+        now = datetime.now().astimezone().isoformat()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO spool_dead (created_at, failed_at, error, payload) VALUES (?, ?, ?, ?)",
+                (now, now, error, dump_snapshots(snapshots))
+            )
+            self._conn.commit()
+            self.stats['dead'] += 1
+
+    def depth(self):
+        # Количество снимков, ожидающих записи в БД
+        with self._lock:
+            return self._conn.execute("SELECT count(*) FROM spool").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()